@@ -0,0 +1,10 @@
+# -*- coding: UTF-8 -*-
+'''
+    benchmarks
+
+    Throughput benchmarks of the magento API client against a local
+    stand-in for the magento XML-RPC API
+
+    :copyright: (c) 2014 by Openlabs Technologies & Consulting (P) LTD
+    :license: AGPLv3, see LICENSE for more details
+'''
@@ -0,0 +1,237 @@
+# -*- coding: UTF-8 -*-
+'''
+    benchmarks.run
+
+    Benchmarks of typical Client workflows against the local stand-in for
+    the magento API. Run them with::
+
+        python -m benchmarks.run --products 20000 --orders 10000
+
+    The stand-in server runs in its own process, and each scenario runs in
+    a fresh process, so the CPU time and peak memory reported are those of
+    the client alone.
+
+    :copyright: (c) 2014 by Openlabs Technologies & Consulting (P) LTD
+    :license: AGPLv3, see LICENSE for more details
+'''
+import os
+import sys
+import time
+import resource
+import traceback
+import multiprocessing
+from optparse import OptionParser
+
+from magento import Client
+from magento.sales import Order
+from magento.instrumentation import HistogramCollector
+from magento.transport import PooledTransport
+
+from .server import Server, Store
+
+
+def product_list(client, options):
+    return len(client.catalog_product.list())
+
+
+def product_list_stream(client, options):
+    return sum(1 for product in client.catalog_product.call_stream(
+        'catalog_product.list', [None, None]
+    ))
+
+
+def order_search_paging(client, options):
+    order_api = client.login().sibling(Order)
+    return sum(1 for order in order_api.iter_search(
+        page_size=options.page_size
+    ))
+
+
+def _skus(options):
+    return [
+        'SKU-%06d' % (id % options.products + 1)
+        for id in xrange(options.updates)
+    ]
+
+
+def inventory_update_loop(client, options):
+    for sku in _skus(options):
+        client.cataloginventory_stock_item.update(sku, {'qty': 5})
+    return options.updates
+
+
+def inventory_update_multicall(client, options):
+    with client.batch(options.batch_size) as batch:
+        results = [
+            batch.cataloginventory_stock_item.update(sku, {'qty': 5})
+            for sku in _skus(options)
+        ]
+    return sum(1 for result in results if result.result())
+
+
+def product_info_map(client, options):
+    return sum(1 for product in client.map(
+        client.catalog_product.info, _skus(options), options.workers
+    ))
+
+
+def expired_session_relogin(client, options):
+    # The session is ended behind the back of the client every
+    # `batch_size` calls, which must then log in again on their own
+    for count, sku in enumerate(_skus(options)):
+        if count % options.batch_size == 0:
+            client.client.endSession(client.session)
+        if count % 2:
+            client.call('catalog_product.info', [sku])
+        else:
+            client.catalog_product.info(sku)
+    return options.updates
+
+
+SCENARIOS = [
+    product_list,
+    product_list_stream,
+    order_search_paging,
+    inventory_update_loop,
+    inventory_update_multicall,
+    product_info_map,
+    expired_session_relogin,
+]
+
+
+def serve(options, queue):
+    """
+    Run the stand-in server and send its URL through the queue
+    """
+    store = Store(options.products, options.orders, options.latency)
+    server = Server(store)
+    queue.put(server.url)
+    server.serve_forever()
+
+
+def run_scenario(scenario, url, options, queue):
+    """
+    Run a scenario and send its figures, or the traceback of its failure,
+    through the queue
+    """
+    try:
+        queue.put(_measure(scenario, url, options))
+    except Exception:
+        queue.put({
+            'scenario': scenario.__name__, 'error': traceback.format_exc()
+        })
+
+
+def _measure(scenario, url, options):
+    collector = HistogramCollector()
+    transport = PooledTransport(
+        fast_parser=options.fast_parser,
+        max_size=options.workers, max_per_host=options.workers
+    )
+    client = Client(
+        url, 'benchmark', 'benchmark',
+        transport=transport, observers=[collector]
+    )
+    client.login()
+    times = os.times()
+    started = time.time()
+    items = scenario(client, options)
+    elapsed = time.time() - started
+    cpu = sum(os.times()[:2]) - sum(times[:2])
+    client.close()
+    calls = sum(
+        collector.count(resource_path)
+        for resource_path in collector.resource_paths()
+    )
+    latencies = {50: 0.0, 95: 0.0, 99: 0.0}
+    for resource_path in collector.resource_paths():
+        # Report the latencies of the most frequent call of the scenario
+        if collector.count(resource_path) * 2 > calls:
+            latencies = collector.percentiles(resource_path)
+    return {
+        'scenario': scenario.__name__,
+        'items': items,
+        'calls': calls,
+        'seconds': elapsed,
+        'latencies': latencies,
+        'cpu': cpu,
+        'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'stats': transport.stats,
+    }
+
+
+def _in_process(target, *args):
+    """
+    Run the target in a child process and return the first value it puts
+    in the queue given to it as last argument
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=target, args=args + (queue, ))
+    process.daemon = True
+    process.start()
+    return process, queue.get()
+
+
+def main(argv=None):
+    parser = OptionParser(usage='python -m benchmarks.run [options]')
+    parser.add_option('--products', type='int', default=10000,
+                      help='Number of products in the catalog')
+    parser.add_option('--orders', type='int', default=5000,
+                      help='Number of orders')
+    parser.add_option('--updates', type='int', default=2000,
+                      help='Number of stock updates and product lookups')
+    parser.add_option('--latency', type='float', default=0.0,
+                      help='Seconds the server takes for every call')
+    parser.add_option('--page-size', type='int', default=1000,
+                      help='Page size of the order search')
+    parser.add_option('--batch-size', type='int', default=100,
+                      help='Number of calls per multiCall')
+    parser.add_option('--workers', type='int', default=8,
+                      help='Number of worker threads of parallel calls')
+    parser.add_option('--fast-parser', action='store_true', default=False,
+                      help='Parse responses with magento.parser')
+    parser.add_option('--scenario', action='append', dest='scenarios',
+                      choices=[scenario.__name__ for scenario in SCENARIOS],
+                      help='Scenario to run, can be repeated. '
+                           'Defaults to all the scenarios.')
+    options, args = parser.parse_args(argv)
+
+    server, url = _in_process(serve, options)
+    out = sys.stdout
+    out.write('%-28s %7s %6s %8s %9s %8s %8s %8s %7s %8s\n' % (
+        'scenario', 'items', 'calls', 'seconds', 'items/s', 'p50 ms',
+        'p95 ms', 'p99 ms', 'cpu s', 'rss MB'
+    ))
+    out.flush()
+    try:
+        for scenario in SCENARIOS:
+            if options.scenarios and \
+                    scenario.__name__ not in options.scenarios:
+                continue
+            process, result = _in_process(
+                run_scenario, scenario, url, options
+            )
+            process.join()
+            if 'error' in result:
+                out.write('%-28s failed\n%s' % (
+                    result['scenario'], result['error']
+                ))
+                continue
+            latencies = result['latencies']
+            out.write(
+                '%-28s %7d %6d %8.2f %9.1f %8.1f %8.1f %8.1f %7.2f %8.1f\n' % (
+                    result['scenario'], result['items'], result['calls'],
+                    result['seconds'], result['items'] / result['seconds'],
+                    latencies[50] * 1000, latencies[95] * 1000,
+                    latencies[99] * 1000, result['cpu'],
+                    # ru_maxrss is in kilobytes on Linux
+                    result['max_rss'] / 1024.0,
+                )
+            )
+            out.flush()
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+# -*- coding: UTF-8 -*-
+'''
+    benchmarks.server
+
+    A local stand-in for the magento XML-RPC API, serving a synthetic
+    catalog and order book
+
+    :copyright: (c) 2014 by Openlabs Technologies & Consulting (P) LTD
+    :license: AGPLv3, see LICENSE for more details
+'''
+import time
+import uuid
+import threading
+from xmlrpclib import Fault
+from SocketServer import ThreadingMixIn
+from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+
+def _match(record, filters):
+    """
+    Tell if a record matches magento style filters
+    `{<attribute>:{<operator>:<value>}}`
+    """
+    for field, condition in (filters or {}).items():
+        if field == 'entity_id':
+            field = 'id'
+        value = record.get(field)
+        if not isinstance(condition, dict):
+            condition = {'eq': condition}
+        if 'from' in condition or 'to' in condition:
+            if 'from' in condition and \
+                    not _number(value) >= _number(condition['from']):
+                return False
+            if 'to' in condition and \
+                    not _number(value) <= _number(condition['to']):
+                return False
+            continue
+        for operator, operand in condition.items():
+            if operator == 'eq' and unicode(value) != unicode(operand):
+                return False
+            if operator == 'neq' and unicode(value) == unicode(operand):
+                return False
+            if operator == 'in' and unicode(value) not in [
+                    unicode(item) for item in operand]:
+                return False
+            if operator == 'gt' and not _number(value) > _number(operand):
+                return False
+            if operator == 'lt' and not _number(value) < _number(operand):
+                return False
+            if operator == 'gteq' and \
+                    not _number(value) >= _number(operand):
+                return False
+            if operator == 'lteq' and \
+                    not _number(value) <= _number(operand):
+                return False
+    return True
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class Store(object):
+    """
+    The synthetic data served by the stand-in, and the implementation of
+    the API resources used by the benchmarks.
+
+    :param products: Number of products in the catalog
+    :param orders: Number of orders
+    :param latency: Seconds every call takes on the server side
+    """
+
+    def __init__(self, products=1000, orders=1000, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.sessions = set()
+        self.products = {}
+        self.skus = {}
+        self.stock = {}
+        for id in xrange(1, products + 1):
+            sku = 'SKU-%06d' % id
+            self.skus[str(id)] = sku
+            self.products[sku] = {
+                'product_id': str(id), 'id': id, 'sku': sku,
+                'name': 'Product %d' % id, 'set': '4', 'type': 'simple',
+                'category_ids': [str(2 + id % 20)], 'website_ids': ['1'],
+                'price': '%d.9900' % (id % 500), 'status': '1',
+                'description': 'Description of product %d. ' % id * 5,
+            }
+            self.stock[sku] = {
+                'product_id': str(id), 'sku': sku,
+                'qty': '%d.0000' % (id % 100), 'is_in_stock': '1',
+            }
+        self.orders = []
+        for id in xrange(1, orders + 1):
+            self.orders.append({
+                'order_id': str(id), 'id': id,
+                'increment_id': str(100000000 + id),
+                'state': 'processing', 'status': 'processing',
+                'customer_email': 'customer%d@example.com' % (id % 300),
+                'grand_total': '%d.0000' % (id % 900 + 10),
+                'created_at': '2014-01-01 00:00:00',
+                'updated_at': '2014-01-%02d 00:00:00' % (id % 28 + 1),
+                'items': [{
+                    'item_id': str(id * 10 + line),
+                    'sku': 'SKU-%06d' % (line + 1),
+                    'qty_ordered': '1.0000',
+                } for line in range(3)],
+            })
+        self.resources = {
+            'catalog_product.list': self.product_list,
+            'catalog_product.info': self.product_info,
+            'catalog_product.update': self.product_update,
+            'cataloginventory_stock_item.list': self.stock_list,
+            'cataloginventory_stock_item.update': self.stock_update,
+            'sales_order.list': self.order_list,
+            'sales_order.search': self.order_search,
+            'sales_order.info': self.order_info,
+            'directory_country.list': self.country_list,
+        }
+
+    # Core API
+
+    def login(self, username, password):
+        session = uuid.uuid4().hex
+        with self.lock:
+            self.sessions.add(session)
+        return session
+
+    def endSession(self, session):
+        with self.lock:
+            self.sessions.discard(session)
+        return True
+
+    def call(self, session, resource_path, arguments=None):
+        if session not in self.sessions:
+            raise Fault(5, 'Session expired. Try to relogin.')
+        if self.latency:
+            time.sleep(self.latency)
+        try:
+            resource = self.resources[resource_path]
+        except KeyError:
+            raise Fault(3, 'Invalid api path.')
+        return resource(*(arguments or []))
+
+    def multiCall(self, session, calls, options=None):
+        if session not in self.sessions:
+            raise Fault(5, 'Session expired. Try to relogin.')
+        results = []
+        for resource_path, arguments in calls:
+            try:
+                results.append(self.call(session, resource_path, arguments))
+            except Fault as fault:
+                results.append({
+                    'isFault': True, 'faultCode': fault.faultCode,
+                    'faultMessage': fault.faultString,
+                })
+        return results
+
+    # Resources
+
+    def _product(self, product):
+        product = unicode(product)
+        try:
+            return self.products[self.skus.get(product, product)]
+        except KeyError:
+            raise Fault(101, 'Product not exists.')
+
+    def product_list(self, filters=None, store_view=None):
+        return [
+            dict((key, record[key]) for key in (
+                'product_id', 'sku', 'name', 'set', 'type',
+                'category_ids', 'website_ids'
+            ))
+            for record in self.products.values() if _match(record, filters)
+        ]
+
+    def product_info(self, product, store_view=None, attributes=None):
+        record = dict(self._product(product))
+        del record['id']
+        return record
+
+    def product_update(self, product, data, store_view=None):
+        self._product(product).update(data)
+        return True
+
+    def stock_list(self, products):
+        skus = [
+            self.skus.get(unicode(product), unicode(product))
+            for product in products
+        ]
+        return [self.stock[sku] for sku in skus if sku in self.stock]
+
+    def stock_update(self, product, data):
+        self.stock[self._product(product)['sku']].update(data)
+        return True
+
+    def order_list(self, filters=None):
+        return [
+            dict((key, value) for key, value in record.items()
+                 if key not in ('id', 'items'))
+            for record in self.orders if _match(record, filters)
+        ]
+
+    def order_search(self, options):
+        orders = self.order_list(options.get('filters'))
+        limit = options.get('limit') or 1000
+        # Like magento collections, pages beyond the last one return the
+        # last page
+        last_page = max((len(orders) + limit - 1) // limit, 1)
+        page = min(options.get('page') or 1, last_page)
+        return orders[(page - 1) * limit:page * limit]
+
+    def order_info(self, increment_id):
+        for record in self.orders:
+            if record['increment_id'] == unicode(increment_id):
+                return dict(
+                    (key, value) for key, value in record.items()
+                    if key != 'id'
+                )
+        raise Fault(100, 'Requested order not exists.')
+
+    def country_list(self):
+        return [
+            {'country_id': code, 'iso2_code': code, 'name': code}
+            for code in ('IN', 'US', 'GB', 'DE', 'FR')
+        ]
+
+
+class RequestHandler(SimpleXMLRPCRequestHandler):
+    """
+    Keeps connections alive and serves the API at the magento path
+    """
+    protocol_version = 'HTTP/1.1'
+    rpc_paths = ('/index.php/api/xmlrpc', )
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Server(ThreadingMixIn, SimpleXMLRPCServer):
+    """
+    A threaded XML-RPC server exposing the core API of a :class:`Store`.
+    Responses are gzip compressed for clients which accept it.
+    """
+    daemon_threads = True
+
+    def __init__(self, store, address=('127.0.0.1', 0)):
+        SimpleXMLRPCServer.__init__(
+            self, address, RequestHandler, allow_none=True,
+            logRequests=False
+        )
+        self.store = store
+        for name in ('login', 'endSession', 'call', 'multiCall'):
+            self.register_function(getattr(store, name), name)
+
+    @property
+    def url(self):
+        """
+        Base URL of the stand-in magento instance
+        """
+        return 'http://%s:%d/' % self.server_address
+
+    def start(self):
+        """
+        Serve requests in a background thread
+        """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
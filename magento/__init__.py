@@ -17,11 +17,12 @@ __all__ = [
             'ProductAttributeSet', 'ProductTypes', 'ProductImages',
             'ProductTierPrice', 'ProductLinks', 'ProductConfigurable',
             'Inventory', 'Order', 'Shipment', 'Invoice', '__version__',
-            'Client',
+            'Client', 'AsyncClient',
             ]
 
 from .api import API
 from .client import Client
+from .parallel import AsyncClient
 from .checkout import Cart, CartCoupon, CartCustomer
 from .checkout import CartPayment, CartProduct, CartShipping
 from .miscellaneous import Store, Magento
@@ -11,10 +11,12 @@
 
 PROTOCOLS = []
 try:
-    from xmlrpclib import ServerProxy
+    from xmlrpclib import ServerProxy, dumps
+    from urllib import splittype, splithost
 except ImportError:
     pass
 else:
+    from magento.transport import PooledTransport
     PROTOCOLS.append('xmlrpc')
 
 try:
@@ -24,16 +26,39 @@ except ImportError:
 else:
     PROTOCOLS.append('soap')
 
+import time
+from contextlib import contextmanager
+from threading import RLock
+
+from magento.instrumentation import CallEvent
 from magento.utils import expand_url
 
 
+#: Fault code of magento for an expired or unknown session
+SESSION_EXPIRED = 5
+
+
+def session_expired(error):
+    """
+    Tell if an exception raised by a call is the fault magento returns for
+    an expired session
+    """
+    code = getattr(error, 'faultCode', None)
+    if code is None:
+        # The WebFault of suds
+        code = getattr(getattr(error, 'fault', None), 'faultcode', None)
+    return str(code) == str(SESSION_EXPIRED)
+
+
 class API(object):
     """
     Generic API to connect to magento
     """
 
     def __init__(self, url, username, password,
-                 version='1.3.2.4', full_url=False, protocol='xmlrpc', transport=None):
+                 version='1.3.2.4', full_url=False, protocol='xmlrpc',
+                 transport=None, cache=None, observers=None, retry=None,
+                 limiter=None):
         """
         This is the Base API class which other APIs have to subclass. By
         default the inherited classes also get the properties of this
@@ -97,7 +122,22 @@ class API(object):
                     be a complete URL
         :param protocol: 'xmlrpc' and 'soap' are valid values
         :param transport: optional xmlrpclib.Transport subclass for
-                    use in xmlrpc requests
+                    use in xmlrpc requests. By default a
+                    :class:`magento.transport.PooledTransport` is used,
+                    which keeps connections alive between calls.
+                    Passing the transport of another API instance shares
+                    its connection pool.
+        :param cache: optional :class:`magento.cache.ResponseCache` from
+                    which the responses of the resources it caches are
+                    served
+        :param observers: optional list of callables, each called with a
+                    :class:`magento.instrumentation.CallEvent` after every
+                    call and multiCall sent to magento
+        :param retry: optional :class:`magento.retry.RetryPolicy` with
+                    which the calls failing with transient errors are sent
+                    again
+        :param limiter: optional :class:`magento.throttle.AdaptiveLimiter`
+                    limiting the number of calls in flight
         """
         assert protocol \
             in PROTOCOLS, "protocol must be %s" % ' OR '.join(PROTOCOLS)
@@ -106,9 +146,19 @@ class API(object):
         self.password = password
         self.protocol = protocol
         self.version = version
+        if transport is None and protocol == 'xmlrpc':
+            transport = PooledTransport(
+                secure=self.url.startswith('https://')
+            )
         self.transport = transport
+        self.cache = cache
+        self.observers = observers if observers is not None else []
+        self.retry = retry
+        self.limiter = limiter
         self.session = None
         self.client = None
+        self.owner = None
+        self.lock = RLock()
 
     def connect(self):
         """
@@ -116,14 +166,89 @@ class API(object):
         but does not login. This could be used as a connection test
         """
         if self.protocol == 'xmlrpc':
-            if self.transport:
-                self.client = ServerProxy(
-                    self.url, allow_none=True, transport=self.transport)
-            else:
-                self.client = ServerProxy(self.url, allow_none=True)
+            self.client = ServerProxy(
+                self.url, allow_none=True, transport=self.transport)
         else:
             self.client = Client(self.url)
 
+    def share(self, api):
+        """
+        Let another API use the connection and session of this API instead
+        of logging in on its own. The session remains owned by this
+        instance and should only be ended through it. When the session
+        expires, the other API logs in again through this instance.
+
+        :param api: An :class:`API` instance for the same magento instance
+        :return: The given API instance
+        """
+        api.client = self.client
+        api.session = self.session
+        api.owner = self
+        return api
+
+    def _current_session(self):
+        """
+        Return the session to send calls with. An API sharing the session
+        of another one takes its current session, which is replaced when it
+        expires.
+        """
+        if self.owner is not None:
+            self.session = self.owner._current_session()
+        return self.session
+
+    def relogin(self, session):
+        """
+        Replace an expired session by a new one. Calls failing at the same
+        time with the same expired session log in only once: the session
+        is only replaced if it still is the expired one.
+
+        An API sharing the session of another one logs in through it, so
+        that the new session is shared as well.
+
+        :param session: The session which expired
+        :return: The API itself
+        """
+        if self.owner is not None:
+            self.owner.relogin(session)
+            self.owner.share(self)
+            return self
+        with self.lock:
+            if self.session == session:
+                # Not self.__enter__, which subclasses like the client
+                # override to keep the session they already hold
+                API.__enter__(self)
+        return self
+
+    def sibling(self, klass):
+        """
+        Return an instance of another API class for the same magento
+        instance, sharing the transport, cache, observers, connection and
+        session of this API. Used by the methods of an API which need the
+        resources of another one::
+
+            tier_price_api = product_api.sibling(ProductTierPrice)
+
+        :param klass: A subclass of :class:`API`
+        """
+        return self.share(klass(
+            self.url, self.username, self.password, self.version, True,
+            self.protocol, self.transport, self.cache, self.observers,
+            self.retry, self.limiter
+        ))
+
+    def reserve_connections(self, count):
+        """
+        Make the pool of keep-alive connections of the transport, if it
+        has one, keep enough connections for `count` threads calling
+        magento at once, so that they do not open a new connection for
+        every call. See :meth:`magento.transport.ConnectionPool.reserve`.
+
+        :param count: Number of threads calling through this API
+        """
+        pool = getattr(self.transport, 'pool', None)
+        if pool is not None:
+            pool.reserve(count)
+
     def __enter__(self):
         """
         Entry point for with statement
@@ -154,19 +279,226 @@ class API(object):
     def call(self, resource_path, arguments):
         """
         Proxy for SOAP call API
+
+        If the API has a cache which caches the resource path, the response
+        is served from the cache when it holds one for these arguments.
+        """
+        cache = self.cache
+        if cache is None or resource_path not in cache.ttls:
+            return self._call(resource_path, arguments)
+        key = cache.key(self.url, resource_path, arguments)
+        try:
+            return cache.get(key)
+        except KeyError:
+            pass
+        result = self._call(resource_path, arguments)
+        cache.set(key, result, cache.ttls[resource_path])
+        return result
+
+    def call_stream(self, resource_path, arguments):
         """
+        Call a resource which returns a list and yield the elements of the
+        list as soon as each one is received, instead of waiting for the
+        whole response. Peak memory is that of a single element::
+
+            for product in api.call_stream('catalog_product.list', [{}]):
+                process(product)
+
+        Responses are only streamed by transports which have a `stream`
+        method, like the default XML-RPC transport. Otherwise the call is
+        made with :meth:`call` and the elements of the list are yielded
+        from its response.
+
+        A streamed call goes through the retry policy, the limiter and the
+        observers of the API like the other calls. It is only sent again
+        until its first element is received, it holds its place in the
+        limiter until the whole list is read, and the observers are told
+        about it once the list is read or the iteration is stopped.
+        """
+        if self.protocol != 'xmlrpc' or \
+                not hasattr(self.transport, 'stream'):
+            for value in self.call(resource_path, arguments):
+                yield value
+            return
+        retry = self.retry
+        for attempt in range(2):
+            session = self._current_session()
+            try:
+                if retry is None:
+                    head, stream = self._start_stream(
+                        resource_path, arguments, session
+                    )
+                else:
+                    head, stream = retry.call(
+                        self.url, retry.is_idempotent(resource_path),
+                        self._start_stream, resource_path, arguments,
+                        session
+                    )
+            except Exception as exc:
+                if attempt or not session_expired(exc):
+                    raise
+                self.relogin(session)
+                continue
+            try:
+                for value in head:
+                    yield value
+                for value in stream:
+                    yield value
+            finally:
+                stream.close()
+            return
+
+    def _start_stream(self, resource_path, arguments, session):
+        """
+        Send a streamed call and wait for the first element of the list, so
+        that the errors of the call itself are raised here
+
+        :return: Tuple of the list of the elements received and the
+                 generator of the following ones
+        """
+        stream = self._stream(resource_path, arguments, session)
+        try:
+            return [next(stream)], stream
+        except StopIteration:
+            return [], stream
+
+    def _stream(self, resource_path, arguments, session):
+        """
+        Yield the elements of the list returned by a call, through the
+        limiter and to the observers of the API
+        """
+        host, handler = splithost(splittype(self.url)[1])
+        request_body = dumps(
+            (session, resource_path, arguments), 'call', allow_none=True
+        )
+        with self._limiting(resource_path):
+            with self._observing(resource_path, arguments):
+                for value in self.transport.stream(
+                        host, handler or '/RPC2', request_body):
+                    yield value
+
+    def _call(self, resource_path, arguments):
         if self.protocol == 'xmlrpc':
-            return self.client.call(self.session, resource_path, arguments)
+            method = self.client.call
         else:
-            return self.client.service.call(
-                self.session, resource_path, arguments)
+            method = self.client.service.call
+        return self._send(
+            resource_path, arguments, method, resource_path, arguments
+        )
 
     def multiCall(self, calls):
         """
         Proxy for multicalls
         """
         if self.protocol == 'xmlrpc':
-            return self.client.multiCall(self.session, calls)
+            method = self.client.multiCall
+        else:
+            method = self.client.service.multiCall
+        return self._send('multiCall', calls, method, calls)
+
+    def _send(self, resource_path, arguments, method, *args):
+        """
+        Send a call or multiCall with the session of the API and the
+        arguments. If magento expired the session, log in again and send
+        it once more with the new session.
+        """
+        session = self._current_session()
+        try:
+            return self._send_with_retry(
+                resource_path, arguments, method, session, *args
+            )
+        except Exception as exc:
+            if not session_expired(exc):
+                raise
+        self.relogin(session)
+        return self._send_with_retry(
+            resource_path, arguments, method, self.session, *args
+        )
+
+    def _send_with_retry(self, resource_path, arguments, method, *args):
+        """
+        Send a call or multiCall with the method and arguments, sending it
+        again if the retry policy of the API allows it
+        """
+        retry = self.retry
+        if retry is None:
+            return self._limit(resource_path, arguments, method, *args)
+        if resource_path == 'multiCall':
+            idempotent = all(
+                retry.is_idempotent(call[0]) for call in arguments
+            )
         else:
-            return self.client.service.multiCall(self.session, calls)
+            idempotent = retry.is_idempotent(resource_path)
+        return retry.call(
+            self.url, idempotent,
+            self._limit, resource_path, arguments, method, *args
+        )
+
+    def _limit(self, resource_path, arguments, method, *args):
+        """
+        Send a call or multiCall once the limiter of the API lets it
+        through, and tell the limiter how it went
+        """
+        if self.limiter is None:
+            return self._observe(resource_path, arguments, method, *args)
+        with self._limiting(resource_path):
+            return self._observe(resource_path, arguments, method, *args)
 
+    @contextmanager
+    def _limiting(self, resource_path):
+        """
+        Wait until the limiter of the API lets a call through, and tell the
+        limiter how it went when the block exits
+        """
+        limiter = self.limiter
+        if limiter is None:
+            yield
+            return
+        limiter.acquire(resource_path)
+        error = None
+        started = time.time()
+        try:
+            yield
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            limiter.release(resource_path, time.time() - started, error)
+
+    def _observe(self, resource_path, arguments, method, *args):
+        """
+        Call the method with the arguments and let the observers of the API
+        know about the call
+        """
+        if not self.observers:
+            return method(*args)
+        with self._observing(resource_path, arguments):
+            return method(*args)
+
+    @contextmanager
+    def _observing(self, resource_path, arguments):
+        """
+        Let the observers of the API know about the call made in the block
+        when it exits
+        """
+        if not self.observers:
+            yield
+            return
+        pop_stats = getattr(self.transport, 'pop_stats', None)
+        if pop_stats is not None:
+            pop_stats()
+        error = None
+        started = time.time()
+        try:
+            yield
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            event = CallEvent(
+                resource_path, len(arguments or []),
+                time.time() - started, error,
+                pop_stats and pop_stats()
+            )
+            for observer in self.observers:
+                observer(event)
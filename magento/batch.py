@@ -0,0 +1,233 @@
+# -*- coding: UTF-8 -*-
+'''
+    magento.batch
+
+    Batching of API calls through multiCall
+
+    :copyright: (c) 2014 by Openlabs Technologies & Consulting (P) LTD
+    :license: AGPLv3, see LICENSE for more details
+'''
+import copy
+from xmlrpclib import Fault
+
+from .api import API
+
+
+class _Queued(Exception):
+    """
+    Raised by the recording `call` of a queued API method to capture the
+    resource path and arguments the method would have called
+    """
+
+    def __init__(self, resource_path, arguments):
+        Exception.__init__(self, resource_path)
+        self.resource_path = resource_path
+        self.arguments = arguments
+
+
+def _record(resource_path, arguments):
+    raise _Queued(resource_path, arguments)
+
+
+class BatchResult(object):
+    """
+    The result of a call queued in a :class:`Batch`. The result becomes
+    available once the batch has been flushed.
+
+    :param resource_path: Resource path of the queued call
+    :param arguments: Arguments of the queued call
+    """
+
+    def __init__(self, resource_path, arguments, api=None, method=None,
+                 args=(), kwargs=None):
+        self.resource_path = resource_path
+        self.arguments = arguments
+        self._api = api
+        self._method = method
+        self._args = args
+        self._kwargs = kwargs or {}
+        self._done = False
+        self._value = None
+        self._exception = None
+
+    def done(self):
+        """
+        Tell if the call has been sent
+        """
+        return self._done
+
+    def result(self):
+        """
+        Return the value of the call, or raise the fault magento returned
+        for it.
+        """
+        if not self._done:
+            raise RuntimeError(
+                "Call to %s has not been sent yet" % self.resource_path
+            )
+        if self._exception is not None:
+            raise self._exception
+        return self._value
+
+    def exception(self):
+        """
+        Return the fault magento returned for the call, if any
+        """
+        if not self._done:
+            raise RuntimeError(
+                "Call to %s has not been sent yet" % self.resource_path
+            )
+        return self._exception
+
+    def set_response(self, response):
+        """
+        Set the raw response of the call. The response goes through the
+        API method which queued the call, so that the result has the same
+        form as the one of a direct call.
+        """
+        if self._method is None:
+            return self.set_result(response)
+        replay = copy.copy(self._api)
+        replay.call = lambda resource_path, arguments: response
+        try:
+            value = getattr(replay, self._method)(*self._args, **self._kwargs)
+        except Exception as exc:
+            return self.set_exception(exc)
+        self.set_result(value)
+
+    def set_result(self, value):
+        self._value = value
+        self._done = True
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._done = True
+
+
+class BatchProxy(object):
+    """
+    Stands in for an API within a batch. Calling a method of the proxy
+    queues the magento call the method would make and returns a
+    :class:`BatchResult` instead of calling magento right away.
+    """
+
+    def __init__(self, batch, api):
+        self._batch = batch
+        self._api = api
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        attr = getattr(self._api, name)
+        if isinstance(attr, API):
+            return BatchProxy(self._batch, attr)
+        if not callable(attr):
+            return attr
+
+        def queue(*args, **kwargs):
+            return self._batch.queue(self._api, name, args, kwargs)
+        queue.__name__ = name
+        queue.__doc__ = attr.__doc__
+        return queue
+
+
+class Batch(BatchProxy):
+    """
+    Queues API calls and sends them to magento through `multiCall`, `size`
+    calls per request.
+
+    Any API method can be queued through the batch, and APIs of a
+    :class:`magento.client.Client` are reached as attributes::
+
+        with client.batch(size=100) as batch:
+            results = [
+                batch.cataloginventory_stock_item.update(sku, {'qty': qty})
+                for sku, qty in stock.items()
+            ]
+        failed = [r for r in results if r.exception()]
+
+    Calls are sent as soon as `size` of them are queued and when the with
+    block exits. The fault magento reports for a single call of a
+    multiCall is raised by :meth:`BatchResult.result` of that call only.
+
+    :param api: A logged in :class:`magento.api.API` through which the
+                calls are sent
+    :param size: Number of calls sent per multiCall
+    """
+
+    def __init__(self, api, size=100):
+        BatchProxy.__init__(self, self, api)
+        self.size = size
+        self.pending = []
+
+    def queue(self, api, method, args=(), kwargs=None):
+        """
+        Queue the call made by a method of an API
+
+        :param api: The API instance
+        :param method: Name of the method of the API
+        :param args: Positional arguments of the method
+        :param kwargs: Keyword arguments of the method
+        :return: :class:`BatchResult`
+        """
+        recorder = copy.copy(api)
+        recorder.call = _record
+        try:
+            value = getattr(recorder, method)(*args, **(kwargs or {}))
+        except _Queued as queued:
+            result = BatchResult(
+                queued.resource_path, queued.arguments,
+                api, method, args, kwargs
+            )
+        else:
+            # The method did not need to call magento
+            result = BatchResult(None, None)
+            result.set_result(value)
+            return result
+        self.pending.append(result)
+        if len(self.pending) >= self.size:
+            self.flush()
+        return result
+
+    def flush(self):
+        """
+        Send all the queued calls
+
+        :return: `list` of :class:`BatchResult` which were sent
+        """
+        sent = []
+        while self.pending:
+            chunk = self.pending[:self.size]
+            try:
+                responses = self._api.multiCall([
+                    [result.resource_path, result.arguments]
+                    for result in chunk
+                ])
+            except Exception as exc:
+                for result in chunk:
+                    result.set_exception(exc)
+                del self.pending[:self.size]
+                raise
+            del self.pending[:self.size]
+            for result, response in zip(chunk, responses):
+                if isinstance(response, dict) and response.get('isFault'):
+                    result.set_exception(Fault(
+                        response.get('faultCode'),
+                        response.get('faultMessage')
+                    ))
+                else:
+                    result.set_response(response)
+            for result in chunk[len(responses):]:
+                result.set_exception(RuntimeError(
+                    "multiCall returned no response for %s" %
+                    result.resource_path
+                ))
+            sent.extend(chunk)
+        return sent
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.flush()
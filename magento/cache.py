@@ -0,0 +1,291 @@
+# -*- coding: UTF-8 -*-
+'''
+    magento.cache
+
+    Caching of API responses which rarely change
+
+    :copyright: (c) 2014 by Openlabs Technologies & Consulting (P) LTD
+    :license: AGPLv3, see LICENSE for more details
+'''
+import copy
+import json
+import time
+import sqlite3
+import xmlrpclib
+from threading import Lock, local
+
+
+#: Seconds for which the responses of the read only reference resources
+#: are cached by default
+DEFAULT_TTLS = {
+    'directory_country.list': 24 * 3600,
+    'directory_region.list': 24 * 3600,
+    'catalog_product_type.list': 3600,
+    'catalog_product_attribute_set.list': 3600,
+    'catalog_product_attribute.options': 3600,
+    'category_attribute.options': 3600,
+    'customer_group.list': 3600,
+    'store.list': 3600,
+}
+
+
+class MemoryBackend(object):
+    """
+    A thread safe in-process cache backend with least recently used
+    eviction once it holds `max_size` responses.
+
+    Cache backends store responses under the keys built by
+    :meth:`ResponseCache.key`, which are tuples of
+    `(version, url, resource_path, arguments)`. A backend implements
+    :meth:`get`, :meth:`set` and :meth:`invalidate`.
+
+    :param max_size: Maximum number of responses held
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._entries = {}
+        self._tick = 0
+        self._lock = Lock()
+
+    def get(self, key):
+        """
+        Return the cached response for the key
+
+        :raises KeyError: If there is no live response for the key
+        """
+        with self._lock:
+            value, expires, tick = self._entries[key]
+            if expires < time.time():
+                del self._entries[key]
+                raise KeyError(key)
+            self._tick += 1
+            self._entries[key] = (value, expires, self._tick)
+        return copy.deepcopy(value)
+
+    def set(self, key, value, expires):
+        """
+        Cache the response for a key until the `expires` timestamp
+        """
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._tick += 1
+            self._entries[key] = (value, expires, self._tick)
+            if len(self._entries) > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        """
+        Drop the expired responses and, if still needed, the least
+        recently used tenth of the responses. Evicting in bulk keeps the
+        cost of eviction low without keeping the entries ordered.
+        """
+        now = time.time()
+        for key, (value, expires, tick) in self._entries.items():
+            if expires < now:
+                del self._entries[key]
+        excess = len(self._entries) - self.max_size
+        if excess > 0:
+            excess = max(excess, self.max_size // 10)
+            by_use = sorted(
+                self._entries, key=lambda key: self._entries[key][2]
+            )
+            for key in by_use[:excess]:
+                del self._entries[key]
+
+    def invalidate(self, resource_path=None, url=None):
+        """
+        Drop cached responses
+
+        :param resource_path: Only drop the responses of this resource path
+        :param url: Only drop the responses of this magento instance
+        """
+        with self._lock:
+            for key in self._entries.keys():
+                if resource_path is not None and key[2] != resource_path:
+                    continue
+                if url is not None and key[1] != url:
+                    continue
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend(object):
+    """
+    A cache backend storing responses in an SQLite database, so that
+    several processes on a host can share the cached responses.
+
+    Responses are stored in their XML-RPC encoding, hence only responses
+    of the XML-RPC protocol can be cached with this backend.
+
+    :param path: Path to the database file. It is created if needed.
+    :param timeout: Seconds to wait for another process to release a lock
+                    on the database
+    """
+
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self._local = local()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS magento_response ("
+            " key TEXT PRIMARY KEY, version TEXT, url TEXT,"
+            " resource_path TEXT, value TEXT, expires REAL)"
+        )
+
+    def _connection(self):
+        """
+        Return the connection of the current thread to the database.
+        SQLite connections cannot be shared between threads.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        """
+        Return the cached response for the key
+
+        :raises KeyError: If there is no live response for the key
+        """
+        row = self._connection().execute(
+            "SELECT value FROM magento_response"
+            " WHERE key = ? AND expires >= ?",
+            (json.dumps(key), time.time())
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        (value, ), method = xmlrpclib.loads(row[0].encode('utf-8'))
+        return value
+
+    def set(self, key, value, expires):
+        """
+        Cache the response for a key until the `expires` timestamp
+        """
+        version, url, resource_path, arguments = key
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO magento_response"
+            " (key, version, url, resource_path, value, expires)"
+            " VALUES (?, ?, ?, ?, ?, ?)", (
+                json.dumps(key), str(version), url, resource_path,
+                xmlrpclib.dumps((value, ), allow_none=True).decode('utf-8'),
+                expires
+            )
+        )
+        connection.execute(
+            "DELETE FROM magento_response WHERE expires < ?", (time.time(), )
+        )
+
+    def invalidate(self, resource_path=None, url=None):
+        """
+        Drop cached responses
+
+        :param resource_path: Only drop the responses of this resource path
+        :param url: Only drop the responses of this magento instance
+        """
+        query, params = "DELETE FROM magento_response WHERE 1 = 1", []
+        if resource_path is not None:
+            query += " AND resource_path = ?"
+            params.append(resource_path)
+        if url is not None:
+            query += " AND url = ?"
+            params.append(url)
+        self._connection().execute(query, params)
+
+    def __len__(self):
+        return self._connection().execute(
+            "SELECT count(*) FROM magento_response WHERE expires >= ?",
+            (time.time(), )
+        ).fetchone()[0]
+
+
+class ResponseCache(object):
+    """
+    A cache of API responses with a time to live per resource path.
+
+    Only the responses of the resource paths listed in `ttls` are cached.
+    A cache is enabled by passing it to an API::
+
+        from magento import Client
+        from magento.cache import ResponseCache
+
+        cache = ResponseCache()
+        client = Client(url, username, password, cache=cache)
+        client.catalog_product_attribute.options('color')  # Calls magento
+        client.catalog_product_attribute.options('color')  # Cached
+
+    Responses are held in memory by default. To share them between the
+    processes of a host, use an :class:`SQLiteBackend`::
+
+        cache = ResponseCache(
+            dict(DEFAULT_TTLS, **{'catalog_category.tree': 600}),
+            backend=SQLiteBackend('/var/tmp/magento-cache.db'),
+        )
+
+    Responses are copied in and out of the cache, so changing a response
+    does not change the cached one.
+
+    :param ttls: Dictionary of resource path to the number of seconds for
+                 which its responses are cached. Defaults to
+                 :data:`DEFAULT_TTLS`
+    :param max_size: Maximum number of responses held by the default
+                     :class:`MemoryBackend`
+    :param backend: The backend storing the responses
+    :param version: Version of the cached responses. Responses cached
+                    under another version are ignored, so changing the
+                    version invalidates a shared cache for all processes
+                    using the new version.
+    """
+
+    def __init__(self, ttls=None, max_size=1024, backend=None, version=1):
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        if backend is None:
+            backend = MemoryBackend(max_size)
+        self.backend = backend
+        self.version = version
+
+    def key(self, url, resource_path, arguments):
+        """
+        Return the key under which the response of a call is cached
+
+        :param url: URL of the magento instance
+        :param resource_path: Resource path of the call
+        :param arguments: Arguments of the call
+        """
+        return (
+            self.version, url, resource_path,
+            json.dumps(arguments, sort_keys=True, default=repr)
+        )
+
+    def get(self, key):
+        """
+        Return the cached response for the key
+
+        :raises KeyError: If there is no live response for the key
+        """
+        return self.backend.get(key)
+
+    def set(self, key, value, ttl):
+        """
+        Cache the response for a key for `ttl` seconds
+        """
+        self.backend.set(key, value, time.time() + ttl)
+
+    def invalidate(self, resource_path=None, url=None):
+        """
+        Drop cached responses
+
+        :param resource_path: Only drop the responses of this resource path
+        :param url: Only drop the responses of this magento instance
+        """
+        self.backend.invalidate(resource_path, url)
+
+    def __len__(self):
+        return len(self.backend)
@@ -9,9 +9,12 @@
     :license: AGPLv3, see LICENSE for more details
 '''
 
+import re
 import warnings
 
 from magento.api import API
+from magento.batch import Batch
+from magento.utils import iter_id_ranges, parallel_map
 
 
 class Category(API):
@@ -182,6 +185,63 @@ class Category(API):
     #: A proxy for :meth:`removeproduct`
     remove_product = removeproduct
 
+    def reconcile_products(self, category_id, desired_positions, store=None,
+                           batch_size=100):
+        """
+        Make the products assigned to a category, and their positions, the
+        desired ones. The assigned products are read once and only the
+        differences are sent, through multiCall, `batch_size` at a time.
+
+        :param category_id: ID of a category
+        :param desired_positions: Dictionary of ID or SKU of product to its
+                                  position in the category. Products with a
+                                  position of None are kept at their current
+                                  position, or assigned without one. Like
+                                  magento, an integer is taken for an ID.
+        :param store: Store ID or Code
+        :param batch_size: Number of calls per multiCall
+        :return: Dictionary with the lists of `assigned`, `updated`,
+                 `removed` and `unchanged` products, and the `failed`
+                 dictionary of product to the exception raised by its call
+        """
+        summary = {
+            'assigned': [], 'updated': [], 'removed': [], 'unchanged': [],
+            'failed': {},
+        }
+        kept = set()
+        records = self.assignedproducts(category_id, store)
+        index = _index_products(records)
+        results = []
+        with Batch(self, batch_size) as batch:
+            for product, position in desired_positions.items():
+                record = _find_product(index, product)
+                if record is None:
+                    results.append(('assigned', product, batch.assignproduct(
+                        category_id, product, position
+                    )))
+                    continue
+                kept.add(record['product_id'])
+                if position is None or \
+                        _normalize(record.get('position'), True) == \
+                        _normalize(position, True):
+                    summary['unchanged'].append(product)
+                    continue
+                results.append(('updated', product, batch.updateproduct(
+                    category_id, record['product_id'], position
+                )))
+            for record in records:
+                if record['product_id'] not in kept:
+                    results.append(('removed', record['product_id'],
+                                    batch.removeproduct(
+                                        category_id, record['product_id']
+                                    )))
+        for change, product, result in results:
+            if result.exception() is None:
+                summary[change].append(product)
+            else:
+                summary['failed'][product] = result.exception()
+        return summary
+
 
 class CategoryAttribute(API):
     """
@@ -252,6 +312,26 @@ class Product(API):
         """
         return self.call('catalog_product.list', [filters, store_view])
 
+    def iter_list(self, filters=None, chunk=5000, max_gap=10,
+                  store_view=None, start=1):
+        """
+        Iterate over the products matching the filters, fetching them
+        `chunk` IDs at a time instead of all at once. See
+        :func:`magento.utils.iter_id_ranges`.
+
+        :param filters: Dictionary of filters.
+        :param chunk: Number of IDs covered by each call
+        :param max_gap: Number of consecutive empty ID ranges after which
+                        the ranges grow
+        :param store_view: Code or ID of store view
+        :param start: ID from which to iterate
+        :return: Generator of `dict`
+        """
+        return iter_id_ranges(
+            lambda filters: self.list(filters, store_view),
+            filters, chunk, max_gap, start=start
+        )
+
     def info(self, product, store_view=None, attributes=None):
         """
         Retrieve product data
@@ -336,6 +416,213 @@ class Product(API):
         """
         return bool(self.call('catalog_product.delete', [product]))
 
+    def bulk_upsert(self, rows, store_view=None, chunk=500, batch_size=100,
+                    workers=1):
+        """
+        Create the products which do not exist and update the others,
+        sending only the fields whose values changed.
+
+        The rows are handled `chunk` at a time: the existing products of
+        the chunk are found with a single list call filtered on their SKUs,
+        their current values of the given fields are read through
+        multiCall, and the creations and updates are sent through
+        multiCall, `batch_size` calls at a time. With several `workers`,
+        chunks are handled concurrently. Existing products are read and
+        updated by ID, as magento would take a numeric SKU for an ID.
+
+        The fields in :data:`NUMERIC_FIELDS` are compared as numbers, and
+        the others as text, so that `'1.50'` differs from `'1.5'`.
+
+        :param rows: Iterable of `(product_type, attribute_set_id, sku,
+                     data)` tuples, as taken by :meth:`create`. The type and
+                     attribute set are only used to create products.
+        :param store_view: ID or Code of store view of the updates
+        :param chunk: Number of rows handled at a time
+        :param batch_size: Number of calls per multiCall
+        :param workers: Number of chunks handled concurrently
+        :return: Dictionary with the `created` dictionary of SKU to the ID
+                 of the product created, the lists of `updated` and
+                 `unchanged` SKUs, and the `failed` dictionary of SKU to
+                 the exception raised by its calls, or by the calls of
+                 its chunk which failed as a whole
+        """
+        summary = {'created': {}, 'updated': [], 'unchanged': [], 'failed': {}}
+        rows = list(rows)
+        chunks = [
+            rows[start:start + chunk] for start in range(0, len(rows), chunk)
+        ]
+        self.reserve_connections(workers)
+        for report in parallel_map(
+                lambda rows: self._upsert(rows, store_view, batch_size),
+                chunks, workers):
+            summary['created'].update(report['created'])
+            summary['updated'].extend(report['updated'])
+            summary['unchanged'].extend(report['unchanged'])
+            summary['failed'].update(report['failed'])
+        return summary
+
+    def _upsert(self, rows, store_view, batch_size):
+        """
+        Create or update a chunk of rows of :meth:`bulk_upsert`. If a list
+        call or a whole multiCall fails, the rows whose outcome is not
+        known fail with its error.
+        """
+        report = {'created': {}, 'updated': [], 'unchanged': [], 'failed': {}}
+        reads, results, error = [], [], None
+        try:
+            # Magento takes numeric SKUs for IDs, so the existing products
+            # are read and updated by the ID the list returns
+            ids = dict(
+                (_text(product['sku']), product['product_id'])
+                for product in self.list(
+                    {'sku': {'in': [sku for _, _, sku, _ in rows]}},
+                    store_view
+                )
+            )
+            with Batch(self, batch_size) as batch:
+                for row in rows:
+                    if _text(row[2]) in ids:
+                        reads.append((row, batch.info(
+                            ids[_text(row[2])], store_view, list(row[3])
+                        )))
+            with Batch(self, batch_size) as batch:
+                for product_type, attribute_set_id, sku, data in rows:
+                    if _text(sku) in ids:
+                        continue
+                    results.append(('created', sku, batch.create(
+                        product_type, attribute_set_id, sku, data
+                    )))
+                for (product_type, attribute_set_id, sku, data), read \
+                        in reads:
+                    if read.exception() is not None:
+                        report['failed'][sku] = read.exception()
+                        continue
+                    changes = _diff(read.result(), data)
+                    if not changes:
+                        report['unchanged'].append(sku)
+                        continue
+                    results.append(('updated', sku, batch.update(
+                        ids[_text(sku)], changes, store_view
+                    )))
+        except Exception as exc:
+            error = exc
+        for change, sku, result in results:
+            if not result.done():
+                continue
+            if result.exception() is not None:
+                report['failed'][sku] = result.exception()
+            elif change == 'created':
+                report['created'][sku] = result.result()
+            else:
+                report['updated'].append(sku)
+        if error is not None:
+            known = set(report['created']) | set(report['updated']) | \
+                set(report['unchanged']) | set(report['failed'])
+            for _, _, sku, _ in rows:
+                if sku not in known:
+                    report['failed'][sku] = error
+        return report
+
+    def update_prices(self, rows, store_view=None, batch_size=100):
+        """
+        Update the tier prices and special prices of many products,
+        skipping the products whose prices already have the given values.
+
+        The current prices are read and the updates are sent through
+        multiCall, `batch_size` calls at a time.
+
+        :param rows: Iterable of `(product, tier_prices, special_price,
+                     from_date, to_date)` tuples, where product is the ID
+                     or SKU of the product and tier_prices the list of tier
+                     prices accepted by :meth:`ProductTierPrice.update`.
+                     Tier prices or a special price given as None are left
+                     unchanged.
+        :param store_view: ID or Code of store view of the special prices
+        :param batch_size: Number of products handled per multiCall
+        :return: Dictionary with the lists of `updated` and `unchanged`
+                 products, and the `failed` dictionary of product to the
+                 exception raised by reading or updating its prices, or by
+                 the calls of its chunk which failed as a whole
+        """
+        summary = {'updated': [], 'unchanged': [], 'failed': {}}
+        tier_price_api = self.sibling(ProductTierPrice)
+        rows = list(rows)
+        for start in range(0, len(rows), batch_size):
+            self._update_prices(
+                rows[start:start + batch_size], tier_price_api, store_view,
+                batch_size, summary
+            )
+        return summary
+
+    def _update_prices(self, rows, tier_price_api, store_view, batch_size,
+                       summary):
+        """
+        Update the prices of a chunk of rows of :meth:`update_prices`. If a
+        whole multiCall fails, the products whose outcome is not known
+        fail with its error.
+        """
+        reads, writes, handled, error = [], [], set(), None
+        try:
+            with Batch(self, batch_size) as batch:
+                for product, tier_prices, special_price, from_date, to_date \
+                        in rows:
+                    reads.append((
+                        tier_prices is not None and batch.queue(
+                            tier_price_api, 'info', (product, )
+                        ),
+                        special_price is not None and
+                        batch.getSpecialPrice(product, store_view),
+                    ))
+            with Batch(self, batch_size) as batch:
+                for row, (tier_read, special_read) in zip(rows, reads):
+                    product, tier_prices, special_price, from_date, to_date \
+                        = row
+                    try:
+                        update_tier_prices = tier_read and \
+                            not _same_tier_prices(
+                                tier_read.result(), tier_prices
+                            )
+                        update_special_price = special_read and \
+                            not _same_special_price(
+                                special_read.result(), special_price,
+                                from_date, to_date
+                            )
+                    except Exception as exc:
+                        summary['failed'][product] = exc
+                        handled.add(product)
+                        continue
+                    calls = []
+                    if update_tier_prices:
+                        calls.append(batch.queue(
+                            tier_price_api, 'update', (product, tier_prices)
+                        ))
+                    if update_special_price:
+                        calls.append(batch.setSpecialPrice(
+                            product, special_price, from_date, to_date,
+                            store_view
+                        ))
+                    if calls:
+                        writes.append((product, calls))
+                    else:
+                        summary['unchanged'].append(product)
+                        handled.add(product)
+        except Exception as exc:
+            error = exc
+        for product, calls in writes:
+            for call in calls:
+                if call.done() and call.exception() is not None:
+                    summary['failed'][product] = call.exception()
+                    handled.add(product)
+                    break
+            else:
+                if all(call.done() for call in calls):
+                    summary['updated'].append(product)
+                    handled.add(product)
+        if error is not None:
+            for row in rows:
+                if row[0] not in handled:
+                    summary['failed'][row[0]] = error
+
 
 class ProductAttribute(API):
     """
@@ -813,3 +1100,193 @@ class Inventory(API):
                 [product, data]
                 )
             )
+
+    def sync(self, desired, chunk=500, batch_size=100):
+        """
+        Bring the stock data of many products to the desired values,
+        updating only the products and fields which differ.
+
+        The current stock data is read `chunk` products at a time and the
+        updates are sent through multiCall, `batch_size` at a time. The
+        fields in :data:`STOCK_NUMERIC_FIELDS` are compared as numbers, so
+        `5` matches the `'5.0000'` magento returns. Fields which the stock
+        list does not return are always sent.
+
+        :param desired: Dictionary of ID or SKU of product to the
+                        dictionary of stock data it should have,
+                        eg {'SKU1': dict(qty=99, is_in_stock='1')}
+        :param chunk: Number of products read per list call
+        :param batch_size: Number of updates sent per multiCall
+        :return: Dictionary with the lists of `updated`, `unchanged` and
+                 `missing` products, and the `failed` dictionary of
+                 product to the exception raised by its update, or by
+                 the calls of its chunk which failed as a whole
+        """
+        summary = {
+            'updated': [], 'unchanged': [], 'missing': [], 'failed': {},
+        }
+        products = list(desired)
+        for start in range(0, len(products), chunk):
+            self._sync(
+                products[start:start + chunk], desired, batch_size, summary
+            )
+        return summary
+
+    def _sync(self, products, desired, batch_size, summary):
+        """
+        Sync a chunk of products of :meth:`sync`. If the list call or a
+        whole multiCall fails, the products whose outcome is not known
+        fail with its error.
+        """
+        results, handled, error = [], set(), None
+        try:
+            index = _index_products(self.list(products))
+            with Batch(self, batch_size) as batch:
+                for product in products:
+                    record = _find_product(index, product, sku_first=True)
+                    if record is None:
+                        summary['missing'].append(product)
+                        handled.add(product)
+                        continue
+                    changes = _diff(
+                        record, desired[product], STOCK_NUMERIC_FIELDS
+                    )
+                    if not changes:
+                        summary['unchanged'].append(product)
+                        handled.add(product)
+                        continue
+                    results.append((product, batch.update(product, changes)))
+        except Exception as exc:
+            error = exc
+        for product, result in results:
+            if not result.done():
+                continue
+            handled.add(product)
+            if result.exception() is None:
+                summary['updated'].append(product)
+            else:
+                summary['failed'][product] = result.exception()
+        if error is not None:
+            for product in products:
+                if product not in handled:
+                    summary['failed'][product] = error
+
+
+#: Fields of products compared as numbers by :meth:`Product.bulk_upsert`
+NUMERIC_FIELDS = frozenset([
+    'price', 'special_price', 'cost', 'msrp', 'weight', 'qty',
+])
+
+#: Fields of the stock data compared as numbers by :meth:`Inventory.sync`
+STOCK_NUMERIC_FIELDS = frozenset([
+    'qty', 'is_in_stock', 'min_qty', 'min_sale_qty', 'max_sale_qty',
+    'notify_stock_qty', 'backorders', 'manage_stock', 'is_qty_decimal',
+])
+
+
+def _text(value):
+    """
+    Return a SKU or an ID as text, to compare it with the unicode values
+    magento returns
+    """
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    return unicode(value)
+
+
+def _index_products(records):
+    """
+    Return the dictionaries of the product IDs and of the SKUs, as text,
+    to the records listed by magento
+    """
+    by_id, by_sku = {}, {}
+    for record in records:
+        by_id[_text(record.get('product_id'))] = record
+        by_sku[_text(record.get('sku'))] = record
+    return by_id, by_sku
+
+
+def _find_product(index, product, sku_first=False):
+    """
+    Return the record of a product from an index of
+    :func:`_index_products`, or None.
+
+    Like magento, a product given as an integer is looked up by ID, and by
+    SKU otherwise. The stock API of magento looks any product up by SKU
+    first, which `sku_first` does as well.
+    """
+    by_id, by_sku = index
+    product = _text(product)
+    if sku_first and product in by_sku:
+        return by_sku[product]
+    if re.match(r'^(0|[+-]?[1-9][0-9]*)$', product):
+        return by_id.get(product.lstrip('+'))
+    return by_sku.get(product)
+
+
+def _normalize(value, numeric=False):
+    """
+    Return a value comparable with the value magento returns for the same
+    field. Numeric values are compared as numbers, so `5` matches the
+    `'5.0000'` magento returns, and other values as text, so that a code
+    like `'0012'` does not match `'12'`.
+    """
+    if isinstance(value, (list, tuple)):
+        # Lists like category_ids are compared regardless of their order
+        return sorted(_normalize(item, numeric) for item in value)
+    if isinstance(value, bool):
+        value = int(value)
+    if numeric:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return value
+    if isinstance(value, (int, long, float)):
+        return str(value)
+    return value
+
+
+def _same_tier_prices(current, tier_prices):
+    """
+    Tell if the tier prices magento returned are the given ones
+    """
+    fields = ('website', 'customer_group_id', 'qty', 'price')
+
+    def key(tier_price):
+        return [
+            _normalize(tier_price.get(field), field in ('qty', 'price'))
+            for field in fields
+        ]
+    return sorted(map(key, current or [])) == sorted(map(key, tier_prices))
+
+
+def _same_special_price(current, special_price, from_date, to_date):
+    """
+    Tell if the special price data magento returned has the given values.
+    Dates are compared by day, the precision of special price dates.
+    """
+    def day(value):
+        return str(value)[:10] if value else None
+    current = current or {}
+    return (
+        _normalize(current.get('special_price'), True) ==
+        _normalize(special_price, True) and
+        day(current.get('special_from_date')) == day(from_date) and
+        day(current.get('special_to_date')) == day(to_date)
+    )
+
+
+def _diff(current, data, numeric_fields=NUMERIC_FIELDS):
+    """
+    Return the items of data which differ from the current record
+
+    :param numeric_fields: Fields compared as numbers
+    """
+    changes = {}
+    for field, value in data.items():
+        numeric = field in numeric_fields
+        if field not in current or \
+                _normalize(current[field], numeric) != \
+                _normalize(value, numeric):
+            changes[field] = value
+    return changes
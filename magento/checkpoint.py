@@ -0,0 +1,52 @@
+# -*- coding: UTF-8 -*-
+'''
+    magento.checkpoint
+
+    Persistence of the progress of incremental exports
+
+    :copyright: (c) 2014 by Openlabs Technologies & Consulting (P) LTD
+    :license: AGPLv3, see LICENSE for more details
+'''
+import os
+import json
+import errno
+
+
+class FileCheckpoint(object):
+    """
+    Keeps a checkpoint in a JSON file, so that an incremental export
+    started by another run of a process resumes where the last one
+    stopped.
+
+    Checkpoint stores implement :meth:`get` and :meth:`set`. The value of
+    a checkpoint is a dictionary whose content is up to the export using
+    it.
+
+    :param path: Path to the file. It is created on the first
+                 :meth:`set`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def get(self):
+        """
+        Return the saved checkpoint, or None if there is none yet
+        """
+        try:
+            with open(self.path) as checkpoint_file:
+                return json.load(checkpoint_file)
+        except IOError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+            return None
+
+    def set(self, value):
+        """
+        Save the checkpoint. The file is replaced at once, so that an
+        interrupted write does not leave a broken checkpoint.
+        """
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as checkpoint_file:
+            json.dump(value, checkpoint_file)
+        os.rename(temporary_path, self.path)
@@ -10,6 +10,8 @@
 from threading import RLock
 
 from .api import API
+from .batch import Batch
+from .utils import parallel_map
 from .catalog import Category, CategoryAttribute, Product, ProductAttribute, \
     ProductAttributeSet, ProductTypes, ProductImages, ProductTierPrice, \
     ProductLinks, ProductConfigurable, Inventory
@@ -47,8 +49,13 @@ class api_class_property(object):
                     obj.version,
                     True,
                     obj.protocol,
+                    obj.transport,
+                    obj.cache,
+                    obj.observers,
+                    obj.retry,
+                    obj.limiter,
                 )
-                obj.__dict__[self.__name__] = value.__enter__()
+                obj.__dict__[self.__name__] = obj.login().share(value)
             return value
 
 
@@ -57,12 +64,17 @@ class Client(API):
     A convenient API which works more closer to the semantics of the WS API
     rather than the with context manager.
 
+    The client logs in once, the first time one of its APIs is accessed,
+    and all the APIs share that session and connection. Call :meth:`close`
+    (or use the client in a with statement) to end the session.
+
     Example usage::
 
         from magento import Client
         client = Client('http://yourstore.com', 'api username', 'api password')
         client.catalog_category.tree()
         client.catalog_product.list()
+        client.close()
 
     :param url: URL to the magento instance.
                 By default the URL is treated as a base url
@@ -79,6 +91,19 @@ class Client(API):
     :param full_url: If set to true, then the `url` is expected to
                 be a complete URL
     :param protocol: 'xmlrpc' and 'soap' are valid values
+    :param transport: optional xmlrpclib.Transport subclass for
+                use in xmlrpc requests. The transport, and with it the
+                pool of keep-alive connections, is shared by all the
+                APIs of the client.
+    :param cache: optional :class:`magento.cache.ResponseCache` shared by
+                all the APIs of the client
+    :param observers: optional list of callables called with a
+                :class:`magento.instrumentation.CallEvent` after every call
+                made by any of the APIs of the client
+    :param retry: optional :class:`magento.retry.RetryPolicy` shared by all
+                the APIs of the client, and with it its circuit breaker
+    :param limiter: optional :class:`magento.throttle.AdaptiveLimiter`
+                shared by all the APIs of the client
     """
 
     catalog_category = api_class_property(Category)
@@ -94,3 +119,84 @@ class Client(API):
     cataloginventory_stock_item = api_class_property(Inventory)
 
     ol_catalog_product_link = api_class_property(ProductConfigurable)
+
+    def login(self):
+        """
+        Log in unless the client already holds a session
+
+        :return: The client itself
+        """
+        with self.lock:
+            if self.session is None:
+                API.__enter__(self)
+        return self
+
+    def batch(self, size=100):
+        """
+        Return a :class:`magento.batch.Batch` which queues the calls made
+        through it and sends them with multiCall, `size` calls at a time::
+
+            with client.batch(size=100) as batch:
+                result = batch.catalog_product.update(sku, data)
+            result.result()
+
+        :param size: Number of calls sent per multiCall
+        """
+        return Batch(self.login(), size)
+
+    def map(self, method, items, workers=4, rate=None):
+        """
+        Call an API method of the client for each of the items in a pool of
+        worker threads, and yield the results in the order of the items as
+        soon as they are available::
+
+            products = client.catalog_product.list(filters)
+            for product in client.map(
+                    client.catalog_product.info,
+                    [product['product_id'] for product in products],
+                    workers=8):
+                process(product)
+
+        Each worker borrows its own connection from the pool of the
+        transport for every call. The pool is made to keep a connection
+        for each worker, see :meth:`magento.api.API.reserve_connections`.
+
+        :param method: API method called with each item, eg
+                       `client.catalog_product.info`
+        :param items: Iterable of items, eg product IDs
+        :param workers: Number of worker threads
+        :param rate: Maximum number of calls started per second (optional)
+        """
+        self.login()
+        self.reserve_connections(workers)
+        return parallel_map(method, items, workers, rate)
+
+    def close(self):
+        """
+        End the session shared by the APIs of this client. The APIs
+        accessed afterwards log in again with a new session.
+        """
+        with self.lock:
+            if self.session is not None:
+                self.__exit__(None, None, None)
+
+    def __enter__(self):
+        """
+        Entry point for with statement
+
+        Logs in unless an API of the client already did, so that the
+        session opened on first use is not replaced and leaked
+        """
+        return self.login()
+
+    def __exit__(self, type, value, traceback):
+        """
+        Exit point
+
+        Closes the session shared by the APIs of this client
+        """
+        with self.lock:
+            for name, api in self.__dict__.items():
+                if isinstance(api, API):
+                    del self.__dict__[name]
+            API.__exit__(self, type, value, traceback)
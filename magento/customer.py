@@ -10,6 +10,7 @@
     :license: AGPLv3, see LICENSE for more details
 '''
 from magento.api import API
+from magento.utils import iter_id_ranges
 
 
 class Customer(API):
@@ -38,6 +39,23 @@ class Customer(API):
         """
         return self.call('customer.list', filters and [filters] or [{}])
 
+    def iter_list(self, filters=None, chunk=5000, max_gap=10, start=1):
+        """
+        Iterate over the customers matching the filters, fetching them
+        `chunk` IDs at a time instead of all at once. See
+        :func:`magento.utils.iter_id_ranges`.
+
+        :param filters: Dictionary of filters.
+        :param chunk: Number of IDs covered by each call
+        :param max_gap: Number of consecutive empty ID ranges after which
+                        the ranges grow
+        :param start: ID from which to iterate
+        :return: Generator of `dict`
+        """
+        return iter_id_ranges(
+            self.list, filters, chunk, max_gap, start=start
+        )
+
     def create(self, data):
         """
         Create a customer using the given data
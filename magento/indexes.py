@@ -0,0 +1,360 @@
+# -*- coding: UTF-8 -*-
+'''
+    magento.indexes
+
+    Local indexes of magento data which is looked up often
+
+    :copyright: (c) 2014 by Openlabs Technologies & Consulting (P) LTD
+    :license: AGPLv3, see LICENSE for more details
+'''
+from threading import RLock
+from xmlrpclib import Fault
+
+from magento.batch import Batch
+
+
+#: Fault code of magento for a category which does not exist
+CATEGORY_NOT_EXISTS = 102
+
+
+def _position(category):
+    return int(category.get('position') or 0)
+
+
+class CategoryIndex(object):
+    """
+    An index of the category tree of magento, built from a single call to
+    :meth:`magento.catalog.Category.tree`.
+
+    Categories are looked up by ID and their paths and ancestors are known
+    without walking the tree. Children and descendants are walked from the
+    children lists of the index, at a cost proportional to their number::
+
+        index = CategoryIndex(client.catalog_category)
+        index[5]['name']
+        index.path(5)           # [1, 2, 5]
+        list(index.descendants(2))
+
+    When categories change in magento, the subtree of a category is
+    reloaded with :meth:`refresh`, which reads it level by level through
+    multiCall instead of fetching the whole tree again.
+
+    Category IDs are integers and the categories are the dictionaries
+    returned by magento, without their `children`.
+
+    :param api: A logged in :class:`magento.catalog.Category` API
+    :param parent_id: ID of the category at the root of the index.
+                      Defaults to the root category of magento.
+    :param store_view: Store view of the category data
+    :param batch_size: Number of calls per multiCall of :meth:`refresh`
+    """
+
+    def __init__(self, api, parent_id=None, store_view=None, batch_size=100):
+        self.api = api
+        self.parent_id = parent_id
+        self.store_view = store_view
+        self.batch_size = batch_size
+        self.root = None
+        self._nodes = {}
+        self._children = {}
+        self._paths = {}
+        self._lock = RLock()
+        self.load()
+
+    def load(self):
+        """
+        Rebuild the whole index from the category tree
+        """
+        tree = self.api.tree(self.parent_id, self.store_view)
+        with self._lock:
+            self._nodes, self._children, self._paths = {}, {}, {}
+            self.root = int(tree['category_id'])
+            stack = [(tree, ())]
+            while stack:
+                node, parent_path = stack.pop()
+                children = node.get('children') or []
+                self._add(node, parent_path)
+                stack.extend(
+                    (child, self._paths[int(node['category_id'])])
+                    for child in children
+                )
+
+    def _add(self, node, parent_path):
+        """
+        Add a category under the category at the end of the parent path
+        """
+        category_id = int(node['category_id'])
+        node = dict(node)
+        node.pop('children', None)
+        self._nodes[category_id] = node
+        self._paths[category_id] = parent_path + (category_id, )
+        self._children[category_id] = []
+        if parent_path:
+            siblings = self._children[parent_path[-1]]
+            siblings.append(category_id)
+            # Magento lists categories by position, so sorting is only
+            # needed for a category moved into an existing parent
+            if len(siblings) > 1 and \
+                    _position(self._nodes[siblings[-2]]) > _position(node):
+                siblings.sort(key=lambda id: _position(self._nodes[id]))
+
+    def _remove(self, category_id, keep_root=False):
+        """
+        Drop a category and its descendants from the index
+        """
+        for descendant in list(self.descendants(category_id)):
+            del self._nodes[descendant]
+            del self._paths[descendant]
+            del self._children[descendant]
+        self._children[category_id] = []
+        if keep_root:
+            return
+        path = self._paths.pop(category_id)
+        if len(path) > 1:
+            self._children[path[-2]].remove(category_id)
+        del self._nodes[category_id]
+        del self._children[category_id]
+
+    def refresh(self, category_id):
+        """
+        Reload a category and its subtree from magento. The category is
+        moved if its parent changed, and dropped if it no longer exists.
+
+        :param category_id: ID of a category of the index
+        """
+        category_id = int(category_id)
+        try:
+            info = self.api.info(category_id, self.store_view)
+        except Fault as fault:
+            if fault.faultCode != CATEGORY_NOT_EXISTS:
+                raise
+            with self._lock:
+                if category_id in self._nodes:
+                    self._remove(category_id)
+            return
+        levels = [[info]]
+        while levels[-1]:
+            with Batch(self.api, self.batch_size) as batch:
+                results = [
+                    batch.level(None, self.store_view, node['category_id'])
+                    for node in levels[-1]
+                ]
+            levels.append([
+                child for result in results for child in result.result()
+            ])
+        with self._lock:
+            parent_id = int(info.get('parent_id') or 0)
+            if category_id == self.root or parent_id not in self._nodes:
+                # The root of the index, or a category moved out of it
+                parent_path = self._paths.get(category_id, (category_id, ))
+                parent_path = parent_path[:-1]
+            else:
+                parent_path = self._paths[parent_id]
+            if category_id in self._nodes:
+                self._remove(category_id, category_id == self.root)
+            if category_id != self.root and parent_id not in self._nodes:
+                return
+            for nodes in levels:
+                for node in nodes:
+                    node_parent = int(node.get('parent_id') or 0)
+                    if node is info:
+                        self._add(node, parent_path)
+                    else:
+                        self._add(node, self._paths[node_parent])
+
+    def __getitem__(self, category_id):
+        return self._nodes[int(category_id)]
+
+    def __contains__(self, category_id):
+        return int(category_id) in self._nodes
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def get(self, category_id, default=None):
+        """
+        Return the category with the ID, or the default if it is not in
+        the index
+        """
+        return self._nodes.get(int(category_id), default)
+
+    def parent(self, category_id):
+        """
+        Return the ID of the parent of a category, or None for the root
+        of the index
+        """
+        path = self._paths[int(category_id)]
+        return path[-2] if len(path) > 1 else None
+
+    def path(self, category_id):
+        """
+        Return the list of IDs from the root of the index to the category
+        """
+        return list(self._paths[int(category_id)])
+
+    def ancestors(self, category_id):
+        """
+        Return the list of IDs of the ancestors of the category, from the
+        root of the index to its parent
+        """
+        return list(self._paths[int(category_id)][:-1])
+
+    def names(self, category_id):
+        """
+        Return the list of names of the categories on the path to the
+        category
+        """
+        return [self._nodes[id]['name'] for id in self.path(category_id)]
+
+    def children(self, category_id):
+        """
+        Return the list of IDs of the children of the category, ordered by
+        position
+        """
+        return list(self._children[int(category_id)])
+
+    def descendants(self, category_id):
+        """
+        Iterate over the IDs of the descendants of the category, depth
+        first
+        """
+        stack = list(reversed(self._children[int(category_id)]))
+        while stack:
+            descendant = stack.pop()
+            yield descendant
+            stack.extend(reversed(self._children[descendant]))
+
+
+class AttributeOptionIndex(object):
+    """
+    An index of the options of the select and multiselect attributes of an
+    attribute set, to resolve option labels to option IDs and back without
+    calling magento. The options of all the attributes are read at once,
+    through multiCall::
+
+        index = AttributeOptionIndex(client.catalog_product_attribute, 4)
+        index.option_id('color', 'Red')     # '12'
+        index.label('color', '12')          # 'Red'
+
+    Options missing in magento are created in bulk by :meth:`ensure`,
+    which is meant to be called with all the labels of an import before
+    resolving them::
+
+        index.ensure({'color': ['Red', 'Teal'], 'size': ['XL']})
+
+    :param api: A logged in :class:`magento.catalog.ProductAttribute` API
+    :param attribute_set_id: ID of the attribute set
+    :param store_view: Store view of the option labels
+    :param batch_size: Number of calls per multiCall
+    :param types: Frontend input types of the attributes indexed
+    """
+
+    def __init__(self, api, attribute_set_id, store_view=None,
+                 batch_size=100, types=('select', 'multiselect')):
+        self.api = api
+        self.attribute_set_id = attribute_set_id
+        self.store_view = store_view
+        self.batch_size = batch_size
+        self.types = types
+        self._ids = {}
+        self._labels = {}
+        self._lock = RLock()
+        self.load()
+
+    def load(self):
+        """
+        Read the attributes of the attribute set and their options
+        """
+        attributes = [
+            attribute['code']
+            for attribute in self.api.list(self.attribute_set_id)
+            if attribute.get('type') in self.types
+        ]
+        with self._lock:
+            self._ids, self._labels = {}, {}
+            self._load_options(attributes)
+
+    def _load_options(self, attributes):
+        """
+        Read the options of the attributes through multiCall
+        """
+        with Batch(self.api, self.batch_size) as batch:
+            results = [
+                (attribute, batch.options(attribute, self.store_view))
+                for attribute in attributes
+            ]
+        for attribute, result in results:
+            ids, labels = {}, {}
+            for option in result.result():
+                # Attributes which are not required have an empty option
+                if option.get('value') in (None, ''):
+                    continue
+                ids[option['label']] = str(option['value'])
+                labels[str(option['value'])] = option['label']
+            self._ids[attribute] = ids
+            self._labels[attribute] = labels
+
+    def attributes(self):
+        """
+        Return the codes of the attributes indexed
+        """
+        return sorted(self._ids)
+
+    def option_id(self, attribute, label, default=None):
+        """
+        Return the ID of the option of the attribute with the label, or
+        the default if there is no such option
+
+        :param attribute: Code of the attribute
+        :param label: Label of the option
+        """
+        return self._ids[attribute].get(label, default)
+
+    def label(self, attribute, option_id, default=None):
+        """
+        Return the label of the option of the attribute with the ID, or
+        the default if there is no such option
+
+        :param attribute: Code of the attribute
+        :param option_id: ID of the option
+        """
+        return self._labels[attribute].get(str(option_id), default)
+
+    def ensure(self, labels):
+        """
+        Create the options which do not exist yet. The options are created
+        through multiCall, with the label given as their admin label, and
+        the options of the attributes changed are then read again.
+
+        :param labels: Dictionary of attribute code to the labels of the
+                       options it needs
+        :return: Dictionary of attribute code to the list of labels of the
+                 options created. Labels of options which magento failed
+                 to create are left out.
+        :raises KeyError: If an attribute is not indexed
+        """
+        with self._lock:
+            queued, results = set(), []
+            with Batch(self.api, self.batch_size) as batch:
+                for attribute, attribute_labels in labels.items():
+                    ids = self._ids[attribute]
+                    for label in attribute_labels:
+                        if label in ids or (attribute, label) in queued:
+                            continue
+                        queued.add((attribute, label))
+                        results.append((attribute, label, batch.addOption(
+                            attribute, {
+                                'label': [{'store_id': ['0'], 'value': label}],
+                                'order': 0,
+                                'is_default': 0,
+                            }
+                        )))
+            created = {}
+            for attribute, label, result in results:
+                if result.exception() is None:
+                    created.setdefault(attribute, []).append(label)
+            if results:
+                self._load_options(
+                    list(set(attribute for attribute, _, _ in results))
+                )
+            return created
@@ -0,0 +1,165 @@
+# -*- coding: UTF-8 -*-
+'''
+    magento.instrumentation
+
+    Observation of the calls made to the magento API
+
+    :copyright: (c) 2014 by Openlabs Technologies & Consulting (P) LTD
+    :license: AGPLv3, see LICENSE for more details
+'''
+import math
+import sys
+from threading import Lock
+
+
+class CallEvent(object):
+    """
+    Describes a call made to magento. Observers of an API receive one
+    event for every call and multiCall sent to magento.
+
+    The transfer figures are only known when the transport reports them,
+    like :class:`magento.transport.PooledTransport` does, and are None
+    otherwise.
+
+    :param resource_path: Resource path of the call, or `multiCall`
+    :param arguments_size: Number of arguments of the call, or number of
+                           calls of a multiCall
+    :param duration: Seconds the call took
+    :param error: The exception raised by the call, if any
+    :param transfer: Dictionary returned by
+                     :meth:`magento.transport.PooledTransport.pop_stats`
+    """
+
+    def __init__(self, resource_path, arguments_size, duration, error=None,
+                 transfer=None):
+        transfer = transfer or {}
+        self.resource_path = resource_path
+        self.arguments_size = arguments_size
+        self.duration = duration
+        self.error = error
+        self.request_bytes = transfer.get('request_bytes')
+        self.request_wire_bytes = transfer.get('request_wire_bytes')
+        self.response_bytes = transfer.get('response_bytes')
+        self.response_wire_bytes = transfer.get('response_wire_bytes')
+        self.network_time = transfer.get('network_time')
+        self.parse_time = transfer.get('parse_time')
+        #: Time spent outside the transport, which is mostly the time
+        #: taken to serialize the request
+        self.serialization_time = None
+        if self.network_time is not None and self.parse_time is not None:
+            self.serialization_time = max(
+                duration - self.network_time - self.parse_time, 0.0
+            )
+
+    def __repr__(self):
+        return '<CallEvent %s %.3fs>' % (self.resource_path, self.duration)
+
+
+class HistogramCollector(object):
+    """
+    An observer which records the duration of calls in a histogram per
+    resource path, from which latency percentiles are computed.
+
+    Durations are counted in buckets growing by `precision`, so the
+    memory used does not grow with the number of calls and percentiles
+    are accurate to within `precision`.
+
+    Example usage::
+
+        collector = HistogramCollector()
+        client = Client(url, username, password, observers=[collector])
+        ...
+        collector.dump()
+
+    :param precision: Relative width of the buckets
+    """
+
+    #: Smallest duration told apart, in seconds
+    resolution = 1e-6
+
+    def __init__(self, precision=0.05):
+        self.precision = precision
+        self._base = math.log(1 + precision)
+        self._histograms = {}
+        self._errors = {}
+        self._lock = Lock()
+
+    def __call__(self, event):
+        bucket = 0
+        if event.duration > self.resolution:
+            bucket = int(math.ceil(
+                math.log(event.duration / self.resolution) / self._base
+            ))
+        with self._lock:
+            histogram = self._histograms.setdefault(event.resource_path, {})
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+            if event.error is not None:
+                self._errors[event.resource_path] = \
+                    self._errors.get(event.resource_path, 0) + 1
+
+    def resource_paths(self):
+        """
+        Return the resource paths for which calls were recorded
+        """
+        with self._lock:
+            return sorted(self._histograms)
+
+    def count(self, resource_path):
+        """
+        Return the number of calls recorded for the resource path
+        """
+        with self._lock:
+            return sum(self._histograms.get(resource_path, {}).values())
+
+    def errors(self, resource_path):
+        """
+        Return the number of failed calls recorded for the resource path
+        """
+        with self._lock:
+            return self._errors.get(resource_path, 0)
+
+    def percentiles(self, resource_path, percentiles=(50, 95, 99)):
+        """
+        Return the latency percentiles of a resource path
+
+        :param resource_path: Resource path
+        :param percentiles: Percentiles to compute
+        :return: Dictionary of percentile to seconds
+        """
+        with self._lock:
+            histogram = sorted(self._histograms.get(resource_path, {}).items())
+        total = sum(count for bucket, count in histogram)
+        result = {}
+        for percentile in percentiles:
+            result[percentile] = None
+            if not total:
+                continue
+            threshold, seen = total * percentile / 100.0, 0
+            for bucket, count in histogram:
+                seen += count
+                if seen >= threshold:
+                    result[percentile] = self.resolution * math.exp(
+                        bucket * self._base
+                    )
+                    break
+        return result
+
+    def dump(self, stream=None):
+        """
+        Write the number of calls, errors and the p50, p95 and p99
+        latencies in milliseconds of every resource path to a stream
+
+        :param stream: File like object, defaults to `sys.stdout`
+        """
+        stream = stream or sys.stdout
+        stream.write('%-45s %8s %6s %10s %10s %10s\n' % (
+            'resource path', 'calls', 'errors', 'p50 ms', 'p95 ms', 'p99 ms'
+        ))
+        for resource_path in self.resource_paths():
+            percentiles = self.percentiles(resource_path)
+            stream.write('%-45s %8d %6d %10.1f %10.1f %10.1f\n' % (
+                resource_path, self.count(resource_path),
+                self.errors(resource_path),
+                percentiles[50] * 1000, percentiles[95] * 1000,
+                percentiles[99] * 1000,
+            ))
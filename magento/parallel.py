@@ -0,0 +1,142 @@
+# -*- coding: UTF-8 -*-
+'''
+    magento.parallel
+
+    Concurrent calls to the magento API
+
+    :copyright: (c) 2014 by Openlabs Technologies & Consulting (P) LTD
+    :license: AGPLv3, see LICENSE for more details
+'''
+from threading import BoundedSemaphore
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .api import API
+from .client import Client
+from .transport import PooledTransport
+
+
+class AsyncAPI(object):
+    """
+    Wraps an API so that calling any of its methods submits the call to a
+    pool of worker threads and returns a
+    :class:`concurrent.futures.Future` right away.
+
+    At most `max_concurrency` calls are in flight at any time. Submitting
+    a call while that many are running blocks the caller until one of them
+    completes, so producers cannot queue up an unbounded backlog.
+
+    Example usage::
+
+        from magento.parallel import AsyncAPI
+
+        with AsyncAPI(client, max_concurrency=32) as async_client:
+            futures = [
+                async_client.catalog_product.info(sku) for sku in skus
+            ]
+            products = [future.result() for future in futures]
+
+    .. note:: The XML-RPC protocol is safe to use from several threads
+              with the default :class:`magento.transport.PooledTransport`.
+              The SOAP client is not, so use one API per thread instead.
+
+    :param api: The :class:`magento.api.API` (or
+                :class:`magento.client.Client`) to wrap. It should already
+                be logged in, unless it is a client.
+    :param max_concurrency: Maximum number of calls in flight
+    """
+
+    def __init__(self, api, max_concurrency=16, executor=None,
+                 semaphore=None):
+        self._api = api
+        self._executor = executor or ThreadPoolExecutor(max_concurrency)
+        self._semaphore = semaphore or BoundedSemaphore(max_concurrency)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        attr = getattr(self._api, name)
+        if isinstance(attr, API):
+            return AsyncAPI(
+                attr, executor=self._executor, semaphore=self._semaphore
+            )
+        if not callable(attr):
+            return attr
+
+        def submit(*args, **kwargs):
+            return self._submit(attr, *args, **kwargs)
+        submit.__name__ = name
+        submit.__doc__ = attr.__doc__
+        return submit
+
+    def _submit(self, function, *args, **kwargs):
+        self._semaphore.acquire()
+        try:
+            future = self._executor.submit(function, *args, **kwargs)
+        except:
+            self._semaphore.release()
+            raise
+        future.add_done_callback(lambda future: self._semaphore.release())
+        return future
+
+    def shutdown(self, wait=True):
+        """
+        Stop the worker threads once the calls in flight are done
+
+        :param wait: Wait for the calls in flight to complete
+        """
+        self._executor.shutdown(wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.shutdown()
+
+
+class AsyncClient(AsyncAPI):
+    """
+    A :class:`magento.client.Client` whose API methods return futures.
+    See :class:`AsyncAPI`.
+
+    Example usage::
+
+        from magento.parallel import AsyncClient
+
+        with AsyncClient(url, username, password) as client:
+            future = client.catalog_product.info('SKU-1')
+            product = future.result()
+
+    The connection pool of the default transport is sized to keep one
+    connection per worker alive.
+
+    :param max_concurrency: Maximum number of calls in flight
+
+    The other parameters are the ones of :class:`magento.client.Client`
+    """
+
+    def __init__(self, url, username, password, version='1.3.2.4',
+                 full_url=False, protocol='xmlrpc', transport=None,
+                 cache=None, observers=None, retry=None, limiter=None,
+                 max_concurrency=16):
+        if transport is None and protocol == 'xmlrpc':
+            transport = PooledTransport(
+                secure=url.startswith('https://'),
+                max_size=max_concurrency,
+                max_per_host=max_concurrency,
+            )
+        client = Client(
+            url, username, password, version, full_url, protocol,
+            transport, cache, observers, retry, limiter
+        )
+        AsyncAPI.__init__(self, client, max_concurrency)
+
+    def close(self):
+        """
+        Wait for the calls in flight and end the session of the client
+        """
+        self.shutdown()
+        self._api.close()
+
+    def __exit__(self, type, value, traceback):
+        self.close()
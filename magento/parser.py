@@ -0,0 +1,150 @@
+# -*- coding: UTF-8 -*-
+'''
+    magento.parser
+
+    Fast unmarshalling of XML-RPC responses
+
+    :copyright: (c) 2014 by Openlabs Technologies & Consulting (P) LTD
+    :license: AGPLv3, see LICENSE for more details
+'''
+import base64
+from datetime import datetime
+from xmlrpclib import Fault, DateTime, Binary
+
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
+
+
+def _boolean(element, use_datetime):
+    text = (element.text or '').strip()
+    if text not in ('0', '1'):
+        raise TypeError("bad boolean value")
+    return text == '1'
+
+
+def _datetime(element, use_datetime):
+    text = (element.text or '').strip()
+    if use_datetime:
+        return datetime.strptime(text, "%Y%m%dT%H:%M:%S")
+    return DateTime(text)
+
+
+def _struct(element, use_datetime):
+    result = {}
+    for member in element:
+        result[member.findtext('name') or ''] = unmarshal(
+            member.find('value'), use_datetime
+        )
+    return result
+
+
+def _array(element, use_datetime):
+    data = element.find('data')
+    if data is None:
+        return []
+    return [unmarshal(value, use_datetime) for value in data]
+
+
+_TYPES = {
+    'string': lambda element, use_datetime: element.text or '',
+    'int': lambda element, use_datetime: int(element.text),
+    'i4': lambda element, use_datetime: int(element.text),
+    'i8': lambda element, use_datetime: int(element.text),
+    'double': lambda element, use_datetime: float(element.text),
+    'nil': lambda element, use_datetime: None,
+    'boolean': _boolean,
+    'dateTime.iso8601': _datetime,
+    'base64': lambda element, use_datetime: Binary(
+        base64.decodestring(element.text or '')
+    ),
+    'struct': _struct,
+    'array': _array,
+}
+
+
+def unmarshal(value, use_datetime=False):
+    """
+    Convert a parsed XML-RPC `<value>` element to a python object, the
+    same way xmlrpclib does.
+
+    :param value: `<value>` element
+    :param use_datetime: Convert dateTime values to datetime objects
+                         instead of xmlrpclib.DateTime
+    """
+    if not len(value):
+        return value.text or ''
+    element = value[0]
+    try:
+        convert = _TYPES[element.tag]
+    except KeyError:
+        raise TypeError("unknown tag %r" % element.tag)
+    return convert(element, use_datetime)
+
+
+def _check_fault(element, use_datetime):
+    if element.tag == 'fault':
+        fault = unmarshal(element.find('value'), use_datetime)
+        raise Fault(**fault)
+
+
+def parse_response(stream, use_datetime=False):
+    """
+    Parse a complete XML-RPC response read from a file like object.
+
+    The document is parsed by the C ElementTree parser and then converted
+    in one pass, which is considerably faster than the event driven
+    unmarshaller of xmlrpclib on large responses.
+
+    :param stream: File like object from which the response is read
+    :param use_datetime: Convert dateTime values to datetime objects
+    :return: Tuple of the response params
+    :raises xmlrpclib.Fault: If the response is a fault
+    """
+    root = ElementTree.parse(stream).getroot()
+    for element in root:
+        _check_fault(element, use_datetime)
+    return tuple(
+        unmarshal(param.find('value'), use_datetime)
+        for param in root.findall('params/param')
+    )
+
+
+def iter_response(stream, use_datetime=False):
+    """
+    Parse an XML-RPC response read from a file like object and yield the
+    elements of the array it returns as soon as each one is complete,
+    without holding the whole array in memory.
+
+    A response which does not return an array is yielded as a single
+    value once it has been parsed.
+
+    :param stream: File like object from which the response is read
+    :param use_datetime: Convert dateTime values to datetime objects
+    :raises xmlrpclib.Fault: If the response is a fault
+    """
+    depth = 0
+    data = None
+    fault = False
+    for event, element in ElementTree.iterparse(
+            stream, events=('start', 'end')):
+        tag = element.tag
+        if event == 'start':
+            if tag == 'fault':
+                fault = True
+            elif tag == 'value':
+                depth += 1
+            elif tag == 'data' and depth == 1:
+                data = element
+            continue
+        if tag == 'value':
+            depth -= 1
+            if depth == 1 and data is not None:
+                yield unmarshal(element, use_datetime)
+                data.clear()
+            elif depth == 0 and data is None and not fault:
+                # The response is not an array
+                yield unmarshal(element, use_datetime)
+        elif tag == 'fault':
+            _check_fault(element, use_datetime)
@@ -0,0 +1,249 @@
+# -*- coding: UTF-8 -*-
+'''
+    magento.retry
+
+    Retries of failed calls and circuit breaking
+
+    :copyright: (c) 2014 by Openlabs Technologies & Consulting (P) LTD
+    :license: AGPLv3, see LICENSE for more details
+'''
+import time
+import random
+import socket
+import httplib
+from threading import Lock
+from urlparse import urlsplit
+from xmlrpclib import ProtocolError, Fault
+
+try:
+    from suds import WebFault
+except ImportError:
+    FAULTS = (Fault, )
+else:
+    FAULTS = (Fault, WebFault)
+
+
+#: Errors of the connection to magento after which a call may succeed if
+#: it is sent again. Timeouts are socket errors. Protocol errors are only
+#: transient for the 5xx and 429 statuses of an overloaded or unavailable
+#: server, see :func:`is_transient`.
+TRANSIENT_ERRORS = (socket.error, httplib.HTTPException, ProtocolError)
+
+#: Methods of the resources which only read data, and can be sent again
+#: safely
+IDEMPOTENT_METHODS = frozenset([
+    'list', 'info', 'items', 'search', 'tree', 'level', 'options',
+    'types', 'attributes', 'assignedProducts', 'getSpecialPrice',
+    'listSuperAttributes', 'getCarriers',
+])
+
+
+def is_transient(error, errors=TRANSIENT_ERRORS):
+    """
+    Tell if a call which failed with the error may succeed if it is sent
+    again
+
+    :param error: The exception raised by the call
+    :param errors: Exceptions which are transient
+    """
+    if not isinstance(error, errors):
+        return False
+    if isinstance(error, ProtocolError):
+        # Statuses like 401 or 404 do not change when sent again
+        return error.errcode == 429 or error.errcode >= 500
+    return True
+
+
+def is_fault(error):
+    """
+    Tell if the error is a fault returned by magento, which shows that
+    magento is up and processed the call
+    """
+    return isinstance(error, FAULTS)
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a magento instance which failed too many
+    times in a row, until the circuit breaker lets calls through again
+    """
+
+    def __init__(self, host, retry_at):
+        Exception.__init__(
+            self, "Calls to %s are suspended after repeated failures" % host
+        )
+        self.host = host
+        self.retry_at = retry_at
+
+
+class CircuitBreaker(object):
+    """
+    Stops calling a host after `threshold` consecutive failed calls,
+    so that calls fail fast with :exc:`CircuitOpenError` while magento is
+    down instead of each waiting for a timeout.
+
+    After `reset_timeout` seconds, a single trial call is let through. The
+    breaker closes again if it succeeds, and stays open for another
+    `reset_timeout` otherwise.
+
+    :param threshold: Number of consecutive failed calls after which the
+                      breaker opens
+    :param reset_timeout: Seconds for which the breaker stays open
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._failures = {}
+        self._open_until = {}
+        self._trials = set()
+        self._lock = Lock()
+
+    def before(self, host):
+        """
+        Tell the breaker a call to the host is about to be sent
+
+        :raises CircuitOpenError: If calls to the host are suspended
+        """
+        with self._lock:
+            open_until = self._open_until.get(host)
+            if open_until is None:
+                return
+            if open_until > time.time() or host in self._trials:
+                raise CircuitOpenError(host, open_until)
+            self._trials.add(host)
+
+    def success(self, host):
+        """
+        Tell the breaker magento answered a call, with a response or a
+        fault
+        """
+        with self._lock:
+            self._failures.pop(host, None)
+            self._open_until.pop(host, None)
+            self._trials.discard(host)
+
+    def failure(self, host):
+        """
+        Tell the breaker a call to the host got no answer from magento
+        """
+        with self._lock:
+            failures = self._failures.get(host, 0) + 1
+            self._failures[host] = failures
+            if failures >= self.threshold or host in self._trials:
+                self._open_until[host] = time.time() + self.reset_timeout
+                self._trials.discard(host)
+
+    def is_open(self, host):
+        """
+        Tell if calls to the host are suspended
+        """
+        with self._lock:
+            return self._open_until.get(host, 0) > time.time()
+
+
+class RetryPolicy(object):
+    """
+    Sends the calls which failed with a transient error again, waiting
+    longer before each attempt. A retry policy is enabled by passing it to
+    an API::
+
+        from magento import Client
+        from magento.retry import RetryPolicy, CircuitBreaker
+
+        retry = RetryPolicy(retries=3, breaker=CircuitBreaker())
+        client = Client(url, username, password, retry=retry)
+
+    Only the calls to resources which just read data are sent again, as a
+    call which changes data may have been done by magento even though its
+    response was lost. The methods listed in :data:`IDEMPOTENT_METHODS`
+    are considered safe, and more resource paths are marked safe with
+    :meth:`mark_idempotent`. A multiCall is sent again when all its calls
+    are safe.
+
+    The delay before a retry is drawn at random up to an exponentially
+    growing bound, so that the clients which failed at the same time do
+    not all retry at the same time.
+
+    :param retries: Maximum number of times a call is sent again
+    :param backoff: Bound in seconds of the delay before the first retry,
+                    doubled for each following one
+    :param max_backoff: Maximum bound in seconds of the delay
+    :param breaker: optional :class:`CircuitBreaker` through which all
+                    calls go, whether they can be retried or not
+    :param errors: Exceptions after which a call is sent again, see
+                   :func:`is_transient`
+    """
+
+    def __init__(self, retries=3, backoff=0.5, max_backoff=30, breaker=None,
+                 errors=TRANSIENT_ERRORS):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker
+        self.errors = errors
+        self.idempotent_paths = set()
+
+    def mark_idempotent(self, *resource_paths):
+        """
+        Mark resource paths, like those of custom APIs, as safe to send
+        again
+        """
+        self.idempotent_paths.update(resource_paths)
+
+    def is_idempotent(self, resource_path):
+        """
+        Tell if calls to the resource path are safe to send again
+        """
+        return resource_path in self.idempotent_paths or \
+            resource_path.rsplit('.', 1)[-1] in IDEMPOTENT_METHODS
+
+    def delay(self, attempt):
+        """
+        Return the seconds to wait before sending a call again
+
+        :param attempt: Number of retries already made
+        """
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** attempt)
+        )
+
+    def is_transient(self, error):
+        """
+        Tell if a call which failed with the error may be sent again
+        """
+        return is_transient(error, self.errors)
+
+    def call(self, url, idempotent, function, *args):
+        """
+        Call the function, sending it again after transient errors if it
+        is idempotent. Only faults of magento count as answers for the
+        circuit breaker. Other errors, like invalid responses or HTTP
+        errors, count as failures.
+
+        :param url: URL of the magento instance called
+        :param idempotent: Tell if the call can be sent again
+        :param function: Function sending the call
+        """
+        host = urlsplit(url).netloc
+        attempt = 0
+        while True:
+            if self.breaker is not None:
+                self.breaker.before(host)
+            try:
+                result = function(*args)
+            except Exception as exc:
+                if self.breaker is not None:
+                    if is_fault(exc):
+                        self.breaker.success(host)
+                    else:
+                        self.breaker.failure(host)
+                if not idempotent or attempt >= self.retries or \
+                        not self.is_transient(exc):
+                    raise
+            else:
+                if self.breaker is not None:
+                    self.breaker.success(host)
+                return result
+            time.sleep(self.delay(attempt))
+            attempt += 1
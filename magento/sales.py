@@ -9,7 +9,22 @@
     :copyright: (c) 2010-2013 by Openlabs Technologies & Consulting (P) LTD
     :license: AGPLv3, see LICENSE for more details
 '''
+import time
+from datetime import datetime, timedelta
+
+from concurrent.futures import ThreadPoolExecutor
+
 from .api import API
+from .retry import RetryPolicy
+from .utils import iter_id_ranges, parallel_map
+
+
+#: State of a paid invoice in magento
+INVOICE_STATE_PAID = 2
+
+
+def _increment_ids(records):
+    return set(record['increment_id'] for record in records)
 
 
 class Order(API):
@@ -56,6 +71,281 @@ class Order(API):
         }
         return self.call('sales_order.search', [options])
 
+    def iter_search(self, filters=None, fields=None, page_size=1000):
+        """
+        Iterate over the orders matching the filters using the search api,
+        one page at a time. The next page is fetched in the background
+        while the orders of the current page are consumed.
+
+        :param filters: `{<attribute>:{<operator>:<value>}}`
+        :param fields: [<String: magento field names>, ...]
+        :param page_size: Number of orders fetched per call
+
+        :return: Generator of `dict`
+        """
+        executor = ThreadPoolExecutor(1)
+        try:
+            page, previous = 1, None
+            future = executor.submit(
+                self.search, filters, fields, page_size, page
+            )
+            while future is not None:
+                orders = future.result()
+                # Magento returns the last page again for pages beyond it
+                if not orders or orders == previous:
+                    break
+                future = None
+                if len(orders) >= page_size:
+                    page += 1
+                    future = executor.submit(
+                        self.search, filters, fields, page_size, page
+                    )
+                for order in orders:
+                    yield order
+                previous = orders
+        finally:
+            executor.shutdown(False)
+
+    def iter_updated(self, checkpoint, filters=None, page_size=1000,
+                     workers=4, details=True, lag=60, max_gap=10):
+        """
+        Iterate over the orders created or updated since the last
+        iteration with the same checkpoint, so that polling for changed
+        orders only reads the orders which changed::
+
+            checkpoint = FileCheckpoint('/var/lib/erp/orders.json')
+            for order in order_api.iter_updated(checkpoint):
+                export(order)
+
+        The orders updated between the checkpoint and `lag` seconds ago
+        are read by ranges of `page_size` order IDs with
+        :func:`magento.utils.iter_id_ranges`, rather than by pages of the
+        search, so that an order updated while they are read does not
+        shift the other orders from one page to the next. Such an order
+        falls out of the window of this iteration and is exported by the
+        next one. Their details are read concurrently by `workers` threads
+        with :meth:`info`.
+
+        The checkpoint holds the end of the window along with the IDs of
+        the orders exported with that `updated_at`, so that orders updated
+        within the same second are neither skipped nor exported twice. It
+        is saved once all the orders have been yielded, so an interrupted
+        iteration is started over by the next one.
+
+        Orders updated less than `lag` seconds ago are left to the next
+        iteration, as magento sets `updated_at` before it commits an order,
+        which may then be read after the end of the window has moved past
+        it.
+
+        :param checkpoint: A checkpoint store, like
+                           :class:`magento.checkpoint.FileCheckpoint`
+        :param filters: `{<attribute>:{<operator>:<value>}}`
+        :param page_size: Number of order IDs covered by each call
+        :param workers: Number of concurrent calls to :meth:`info`
+        :param details: Yield the order info instead of the order as
+                        listed by the search
+        :param lag: Seconds after an update after which an order is
+                    exported. `updated_at` is in UTC, so the clock of the
+                    host should be in sync with the one of magento.
+        :param max_gap: Number of consecutive empty ID ranges after which
+                        the ranges grow
+
+        :return: Generator of `dict`
+        """
+        state = checkpoint.get() or {}
+        since = state.get('updated_at')
+        seen = set(state.get('order_ids') or [])
+        until = (
+            datetime.utcnow() - timedelta(seconds=lag)
+        ).strftime('%Y-%m-%d %H:%M:%S')
+        window = {'to': until}
+        if since is not None:
+            window['from'] = since
+        filters = dict(filters or {}, updated_at=window)
+        # Orders exported with the end of the window as `updated_at`
+        boundary = seen if until == since else set()
+
+        def changed_orders():
+            for order in iter_id_ranges(
+                    lambda filters: self.search(filters, None, page_size),
+                    filters, page_size, max_gap):
+                updated_at = order['updated_at']
+                order_id = str(order['order_id'])
+                if updated_at == since and order_id in seen:
+                    continue
+                if updated_at == until:
+                    boundary.add(order_id)
+                yield order
+
+        orders = changed_orders()
+        if details:
+            self.reserve_connections(workers)
+            orders = parallel_map(
+                lambda order: self.info(order['increment_id']),
+                orders, workers
+            )
+        for order in orders:
+            yield order
+        checkpoint.set({'updated_at': until, 'order_ids': sorted(boundary)})
+
+    def fulfil(self, fulfilments, workers=8, retries=2, retry_delay=1.0):
+        """
+        Ship, track, invoice and capture many orders. The orders are
+        fulfilled concurrently by `workers` threads, so a slow order does
+        not hold up the others::
+
+            outcomes = order_api.fulfil([{
+                'increment_id': '100000001',
+                'items': {'12': 1},
+                'tracks': [('ups', 'UPS', '1Z999')],
+            }])
+            failed = dict(
+                (increment_id, outcome) for increment_id, outcome
+                in outcomes.items() if outcome['error']
+            )
+
+        Each order goes through the steps `shipment`, `track`, `invoice`
+        and `capture` in turn, and stops at the first step which fails. A
+        step is tried again up to `retries` times after a transient error
+        (see :func:`magento.retry.is_transient`), but not after a fault of
+        magento.
+
+        A step whose response was lost may have been done by magento, so
+        magento is asked whether it was before trying it again: the
+        shipments and invoices of the order are listed and compared with
+        those it had before the step, the tracks of the shipment are read,
+        and the invoice is read to know whether it is paid. The order must
+        thus not be shipped or invoiced by another process at the same
+        time.
+
+        :param fulfilments: Iterable of dictionaries with the keys
+
+            * `increment_id`: Increment ID of the order
+            * `items`: Dictionary of order item ID to the quantity shipped
+              and invoiced. Defaults to all the items left.
+            * `tracks`: List of `(carrier, title, track_number)` tuples
+            * `invoice`: Create an invoice, defaults to True
+            * `capture`: Capture the invoice, defaults to True
+            * `email`: Send the shipment and invoice e-mails, defaults to
+              True
+
+        :param workers: Number of orders fulfilled concurrently
+        :param retries: Number of times a step is tried again
+        :param retry_delay: Bound in seconds of the delay before the first
+                            retry of a step, doubled for each following
+                            one, see :meth:`magento.retry.RetryPolicy.delay`
+        :return: Dictionary of order increment ID to a dictionary of the
+                 `shipment` and `invoice` increment IDs created, the
+                 `tracks` IDs added, whether the invoice was `captured`,
+                 and the `step` which failed and its `error`, if any
+        """
+        shipment_api = self.sibling(Shipment)
+        invoice_api = self.sibling(Invoice)
+        policy = RetryPolicy(retries, retry_delay)
+
+        def step(function, args, done=None):
+            """
+            Call the function, trying it again after transient errors. If
+            `done` is given, it is called before each retry and returns the
+            result of the step if magento did it, or None.
+            """
+            attempt = 0
+            while True:
+                try:
+                    if attempt and done is not None:
+                        result = done()
+                        if result is not None:
+                            return result
+                    return function(*args)
+                except Exception as exc:
+                    if attempt >= retries or not policy.is_transient(exc):
+                        raise
+                time.sleep(policy.delay(attempt))
+                attempt += 1
+
+        def created(api, order_id, existing):
+            """
+            Return a function returning the increment ID of the record
+            created for the order since the existing ones were listed
+            """
+            def done():
+                new = _increment_ids(
+                    step(api.list, [{'order_id': {'eq': order_id}}])
+                ) - existing
+                return max(new) if new else None
+            return done
+
+        def tracked(shipment, track_number, known):
+            def done():
+                info = step(shipment_api.info, [shipment])
+                for track in info.get('tracks') or []:
+                    track_id = int(track.get('track_id') or track['entity_id'])
+                    number = track.get('track_number') or track.get('number')
+                    if number == track_number and track_id not in known:
+                        return track_id
+            return done
+
+        def paid(invoice):
+            def done():
+                info = step(invoice_api.info, [invoice])
+                if str(info.get('state')) == str(INVOICE_STATE_PAID):
+                    return True
+            return done
+
+        def fulfil(fulfilment):
+            increment_id = fulfilment['increment_id']
+            items = fulfilment.get('items') or {}
+            email = fulfilment.get('email', True)
+            outcome = {
+                'shipment': None, 'tracks': [], 'invoice': None,
+                'captured': False, 'step': None, 'error': None,
+            }
+            try:
+                outcome['step'] = 'shipment'
+                order_id = step(self.info, [increment_id])['order_id']
+                shipments = _increment_ids(step(
+                    shipment_api.list, [{'order_id': {'eq': order_id}}]
+                ))
+                outcome['shipment'] = step(
+                    shipment_api.create,
+                    [increment_id, items, None, email],
+                    created(shipment_api, order_id, shipments)
+                )
+                outcome['step'] = 'track'
+                for carrier, title, track_number in \
+                        fulfilment.get('tracks') or []:
+                    outcome['tracks'].append(step(
+                        shipment_api.addtrack,
+                        [outcome['shipment'], carrier, title, track_number],
+                        tracked(
+                            outcome['shipment'], track_number,
+                            set(int(track) for track in outcome['tracks'])
+                        )
+                    ))
+                if fulfilment.get('invoice', True):
+                    outcome['step'] = 'invoice'
+                    invoices = _increment_ids(step(
+                        invoice_api.list, [{'order_id': {'eq': order_id}}]
+                    ))
+                    outcome['invoice'] = step(
+                        invoice_api.create,
+                        [increment_id, items, None, email],
+                        created(invoice_api, order_id, invoices)
+                    )
+                    if fulfilment.get('capture', True):
+                        outcome['step'] = 'capture'
+                        outcome['captured'] = step(
+                            invoice_api.capture, [outcome['invoice']],
+                            paid(outcome['invoice'])
+                        )
+                outcome['step'] = None
+            except Exception as exc:
+                outcome['error'] = exc
+            return increment_id, outcome
+
+        self.reserve_connections(workers)
+        return dict(parallel_map(fulfil, fulfilments, workers))
+
     def info(self, order_increment_id):
         """
         Retrieve order info
@@ -131,6 +421,23 @@ class Shipment(API):
         """
         return self.call('sales_order_shipment.list', [filters])
 
+    def iter_list(self, filters=None, chunk=5000, max_gap=10, start=1):
+        """
+        Iterate over the shipments matching the filters, fetching them
+        `chunk` IDs at a time instead of all at once. See
+        :func:`magento.utils.iter_id_ranges`.
+
+        :param filters: Dictionary of filters.
+        :param chunk: Number of IDs covered by each call
+        :param max_gap: Number of consecutive empty ID ranges after which
+                        the ranges grow
+        :param start: ID from which to iterate
+        :return: Generator of `dict`
+        """
+        return iter_id_ranges(
+            self.list, filters, chunk, max_gap, start=start
+        )
+
     def info(self, shipment_increment_id):
         """
         Retrieve shipment info
@@ -262,6 +569,23 @@ class Invoice(API):
         """
         return self.call('sales_order_invoice.list', [filters])
 
+    def iter_list(self, filters=None, chunk=5000, max_gap=10, start=1):
+        """
+        Iterate over the invoices matching the filters, fetching them
+        `chunk` IDs at a time instead of all at once. See
+        :func:`magento.utils.iter_id_ranges`.
+
+        :param filters: Dictionary of filters.
+        :param chunk: Number of IDs covered by each call
+        :param max_gap: Number of consecutive empty ID ranges after which
+                        the ranges grow
+        :param start: ID from which to iterate
+        :return: Generator of `dict`
+        """
+        return iter_id_ranges(
+            self.list, filters, chunk, max_gap, start=start
+        )
+
     def info(self, invoice_increment_id):
         """
         Retrieve invoice info
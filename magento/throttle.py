@@ -0,0 +1,200 @@
+# -*- coding: UTF-8 -*-
+'''
+    magento.throttle
+
+    Throttling of calls to the magento API
+
+    :copyright: (c) 2014 by Openlabs Technologies & Consulting (P) LTD
+    :license: AGPLv3, see LICENSE for more details
+'''
+import time
+from threading import Condition, Lock
+
+from magento.retry import is_transient
+
+
+class RateLimiter(object):
+    """
+    A thread safe token bucket which lets through at most `rate` calls per
+    second on average, with bursts of up to `burst` calls.
+
+    Example usage::
+
+        limiter = RateLimiter(10)
+        for sku in skus:
+            limiter.acquire()
+            product_api.info(sku)
+
+    :param rate: Number of calls per second
+    :param burst: Number of calls which can be made at once after the
+                  limiter has been idle
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.time()
+        self._lock = Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Block until the given number of calls may be made
+        """
+        while True:
+            with self._lock:
+                now = time.time()
+                self._tokens = min(
+                    self.burst,
+                    self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+
+
+class _PathState(object):
+    """
+    The concurrency limit of a resource path and the latencies observed
+    """
+
+    def __init__(self, limit):
+        self.limit = float(limit)
+        self.in_flight = 0
+        self.latency = None
+        self.baseline = None
+        self.decreased = 0.0
+
+
+class AdaptiveLimiter(object):
+    """
+    A thread safe limiter of the number of calls in flight per resource
+    path, which finds how many concurrent calls magento can take by
+    additive increase and multiplicative decrease (AIMD), like TCP does.
+
+    While calls succeed in about the usual time, the limit of a resource
+    path grows by about one call per `limit` calls completed. When a call
+    fails with a transient error, like a timeout or a 503, or when the
+    latency of the resource path grows beyond `tolerance` times the lowest
+    latency seen, the limit is multiplied by `backoff`, at most once per
+    latency period. A limiter is enabled by passing it to an API, along
+    with enough workers for the parallel helpers to reach its maximum::
+
+        from magento import Client
+        from magento.throttle import AdaptiveLimiter
+
+        limiter = AdaptiveLimiter(maximum=32, rate=200)
+        client = Client(url, username, password, limiter=limiter)
+        for product in client.map(client.catalog_product.info, skus,
+                                  workers=32):
+            ...
+
+    :meth:`magento.client.Client.map` makes the pool of connections of the
+    transport keep one connection per worker. Threads calling magento on
+    their own should call :meth:`magento.api.API.reserve_connections`
+    first, or each call beyond the pool size opens a new connection.
+
+    :param initial: Limit of a resource path before any call completed
+    :param minimum: Lowest limit
+    :param maximum: Highest limit
+    :param backoff: Factor applied to the limit on overload
+    :param tolerance: Ratio of the latency to the lowest latency seen
+                      beyond which magento is considered overloaded
+    :param smoothing: Weight of the latest call in the moving average of
+                      the latency
+    :param rate: optional maximum number of calls started per second for
+                 all the resource paths, enforced with a
+                 :class:`RateLimiter`
+    :param burst: Number of calls which can be started at once when the
+                  rate is limited
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=64, backoff=0.5,
+                 tolerance=2.0, smoothing=0.2, rate=None, burst=1):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.rate_limiter = rate and RateLimiter(rate, burst)
+        self._paths = {}
+        self._condition = Condition(Lock())
+
+    def _state(self, resource_path):
+        state = self._paths.get(resource_path)
+        if state is None:
+            state = self._paths[resource_path] = _PathState(self.initial)
+        return state
+
+    def acquire(self, resource_path):
+        """
+        Block until a call to the resource path may be started
+        """
+        with self._condition:
+            state = self._state(resource_path)
+            while state.in_flight >= int(state.limit):
+                self._condition.wait()
+            state.in_flight += 1
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+
+    def release(self, resource_path, duration, error=None):
+        """
+        Tell the limiter a call to the resource path completed, and adapt
+        the limit of the resource path to its outcome
+
+        :param resource_path: Resource path of the call
+        :param duration: Seconds the call took
+        :param error: The exception raised by the call, if any
+        """
+        now = time.time()
+        with self._condition:
+            state = self._state(resource_path)
+            saturated = state.in_flight >= int(state.limit)
+            state.in_flight -= 1
+            overloaded = error is not None and is_transient(error)
+            if error is None:
+                if state.latency is None:
+                    state.latency = duration
+                else:
+                    state.latency += self.smoothing * (
+                        duration - state.latency
+                    )
+                if state.baseline is None or duration < state.baseline:
+                    state.baseline = duration
+                else:
+                    # Let the baseline follow lasting changes of latency
+                    state.baseline += 0.01 * (state.latency - state.baseline)
+                overloaded = \
+                    state.latency > state.baseline * self.tolerance
+            if overloaded:
+                # Decrease at most once per latency period, as the calls
+                # in flight were started before the previous decrease
+                if now - state.decreased > (state.latency or duration):
+                    state.limit = max(
+                        self.minimum, state.limit * self.backoff
+                    )
+                    state.decreased = now
+            elif error is None and saturated:
+                state.limit = min(
+                    self.maximum, state.limit + 1.0 / state.limit
+                )
+            self._condition.notify_all()
+
+    def limit(self, resource_path):
+        """
+        Return the current concurrency limit of the resource path
+        """
+        with self._condition:
+            return int(self._state(resource_path).limit)
+
+    def in_flight(self, resource_path):
+        """
+        Return the number of calls to the resource path in flight
+        """
+        with self._condition:
+            return self._state(resource_path).in_flight
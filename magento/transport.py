@@ -0,0 +1,441 @@
+# -*- coding: UTF-8 -*-
+'''
+    magento.transport
+
+    Keep-alive XML-RPC transport backed by a pool of HTTP connections
+
+    :copyright: (c) 2014 by Openlabs Technologies & Consulting (P) LTD
+    :license: AGPLv3, see LICENSE for more details
+'''
+import sys
+import time
+import zlib
+import errno
+import socket
+import httplib
+from threading import Lock, local
+from xmlrpclib import Transport, ProtocolError, Fault
+
+from .parser import parse_response, iter_response
+
+
+class ConnectionPool(object):
+    """
+    A thread safe pool of idle keep-alive HTTP connections, keyed by the
+    scheme and host they were opened to.
+
+    Connections are only pooled while they are idle. A caller which finds
+    no idle connection opens a new one, so the pool never blocks. When a
+    connection is given back and the pool is already holding
+    `max_per_host` idle connections for that host (or `max_size` in total)
+    the connection is closed instead of being kept around.
+
+    :param max_size: Maximum number of idle connections kept in total
+    :param max_per_host: Maximum number of idle connections kept per host
+    :param idle_timeout: Seconds after which an idle connection is
+                         discarded instead of being reused
+    """
+
+    def __init__(self, max_size=10, max_per_host=4, idle_timeout=60):
+        self.max_size = max_size
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self._idle = {}
+        self._size = 0
+        self._lock = Lock()
+
+    def acquire(self, key):
+        """
+        Return an idle connection for the given key or None if there is
+        no connection which could be reused.
+        """
+        stale = []
+        connection = None
+        with self._lock:
+            idle = self._idle.get(key)
+            now = time.time()
+            while idle:
+                candidate, last_used = idle.pop()
+                self._size -= 1
+                if now - last_used < self.idle_timeout:
+                    connection = candidate
+                    break
+                stale.append(candidate)
+        for candidate in stale:
+            candidate.close()
+        return connection
+
+    def release(self, key, connection):
+        """
+        Give a connection back to the pool once the response on it has
+        been read completely.
+        """
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_per_host and self._size < self.max_size:
+                idle.append((connection, time.time()))
+                self._size += 1
+                return
+        connection.close()
+
+    def reserve(self, count):
+        """
+        Raise the limits of the pool so that it keeps at least `count` idle
+        connections per host, for `count` threads calling the same host
+        at once. Limits already higher are left as they are.
+        """
+        with self._lock:
+            self.max_per_host = max(self.max_per_host, count)
+            self.max_size = max(self.max_size, count)
+
+    def clear(self):
+        """
+        Close all the idle connections held by the pool
+        """
+        with self._lock:
+            idle, self._idle, self._size = self._idle, {}, 0
+        for connections in idle.values():
+            for connection, last_used in connections:
+                connection.close()
+
+
+class ResponseReader(object):
+    """
+    A file like reader of the body of an HTTP response, which decodes gzip
+    and deflate encoded bodies on the fly and counts the bytes received.
+    Other attributes are those of the response.
+
+    :param response: The `httplib.HTTPResponse`
+    """
+
+    def __init__(self, response):
+        self.response = response
+        self.wire_bytes = 0
+        self.bytes = 0
+        #: Seconds spent waiting for data in :meth:`read`
+        self.read_time = 0.0
+        self._buffer = ''
+        self._decompressor = None
+        encoding = (response.getheader('content-encoding') or '').lower()
+        if encoding == 'gzip':
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self._decompressor = zlib.decompressobj()
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+    def read(self, size=-1):
+        """
+        Read up to `size` decoded bytes, or all of them if size is negative
+        """
+        started = time.time()
+        try:
+            return self._read(size)
+        finally:
+            self.read_time += time.time() - started
+
+    def _read(self, size):
+        if self._decompressor is None:
+            if size is None or size < 0:
+                data = self.response.read()
+            else:
+                data = self.response.read(size)
+            self.wire_bytes += len(data)
+            self.bytes += len(data)
+            return data
+        while size is None or size < 0 or len(self._buffer) < size:
+            data = self.response.read(16384)
+            if not data:
+                self._buffer += self._decompressor.flush()
+                break
+            self.wire_bytes += len(data)
+            self._buffer += self._decompressor.decompress(data)
+        if size is None or size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        self.bytes += len(data)
+        return data
+
+
+def _connection_dropped(error):
+    """
+    Tell if an error of a request shows that the server closed the
+    connection without reading the request, so that sending it again
+    cannot make magento process it twice
+    """
+    if isinstance(error, httplib.BadStatusLine):
+        # No byte of a response was received, as opposed to an invalid
+        # status line
+        line = error.line or ''
+        return not line.strip("'\"") or line.startswith('No status line')
+    return isinstance(error, socket.error) and error.errno in (
+        errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE
+    )
+
+
+class PooledTransport(Transport):
+    """
+    An XML-RPC transport which keeps HTTP connections alive between
+    requests and reuses them through a :class:`ConnectionPool`.
+
+    Unlike the standard transport, a single instance can safely be shared
+    between threads and between several :class:`magento.api.API`
+    instances, each request borrowing a connection from the pool for the
+    time of the round trip.
+
+    :param use_datetime: Convert dateTime values to datetime objects
+    :param secure: Use HTTPS connections
+    :param pool: An existing :class:`ConnectionPool` to use. If not given a
+                 new pool is created from the remaining arguments
+    :param max_size: See :class:`ConnectionPool`
+    :param max_per_host: See :class:`ConnectionPool`
+    :param idle_timeout: See :class:`ConnectionPool`
+    :param timeout: Socket timeout in seconds for new connections
+    :param fast_parser: Parse responses with
+                        :func:`magento.parser.parse_response`, which is
+                        several times faster than xmlrpclib on large
+                        responses
+    :param accept_gzip: Ask the server for gzip compressed responses.
+                        Compressed responses are decoded transparently.
+    :param compress_threshold: Gzip compress the requests larger than
+                        this number of bytes, eg large multiCall batches
+                        or image uploads. Off by default, as the web
+                        server has to be set up to decode compressed
+                        requests.
+
+    The bytes sent and received, before and after compression, are added
+    up in :attr:`stats`. The figures of the last request made by a thread
+    are returned by :meth:`pop_stats`.
+    """
+
+    def __init__(self, use_datetime=0, secure=False, pool=None,
+                 max_size=10, max_per_host=4, idle_timeout=60, timeout=None,
+                 fast_parser=False, accept_gzip=True, compress_threshold=None):
+        Transport.__init__(self, use_datetime)
+        self.secure = secure
+        self.timeout = timeout
+        self.fast_parser = fast_parser
+        self.accept_gzip = accept_gzip
+        self.compress_threshold = compress_threshold
+        if pool is None:
+            pool = ConnectionPool(max_size, max_per_host, idle_timeout)
+        self.pool = pool
+        #: Requests made and bytes transferred by the transport. The
+        #: `wire` counts are the bytes actually sent over the network.
+        self.stats = {
+            'requests': 0,
+            'request_bytes': 0,
+            'request_wire_bytes': 0,
+            'response_bytes': 0,
+            'response_wire_bytes': 0,
+        }
+        self._stats_lock = Lock()
+        self._local = local()
+
+    def request(self, host, handler, request_body, verbose=0):
+        """
+        Send a complete request and return the unmarshalled response.
+        """
+        key, connection, response = self.start_request(
+            host, handler, request_body, verbose
+        )
+        parse_started = time.time()
+        try:
+            self.verbose = verbose
+            result = self.parse_response(response)
+        except Fault:
+            self.done(key, connection, response, parse_started)
+            raise
+        except:
+            connection.close()
+            raise
+        self.done(key, connection, response, parse_started)
+        return result
+
+    def stream(self, host, handler, request_body):
+        """
+        Send a complete request and yield the elements of the array in the
+        response as soon as each one has been received and parsed. See
+        :func:`magento.parser.iter_response`.
+
+        The connection goes back to the pool only if the whole response
+        is consumed.
+        """
+        key, connection, response = self.start_request(
+            host, handler, request_body
+        )
+        complete = False
+        try:
+            for value in iter_response(response, self._use_datetime):
+                yield value
+            complete = True
+        finally:
+            if complete:
+                self.done(key, connection, response)
+            else:
+                connection.close()
+
+    def start_request(self, host, handler, request_body, verbose=0):
+        """
+        Send a request on a pooled connection and return the key of the
+        connection in the pool, the connection and the response, whose
+        body is still to be read.
+
+        A pooled connection may have been closed by the server while it
+        was idle, so a request which fails on a reused connection before
+        the server could have processed it is sent once more on a fresh
+        one, like :meth:`xmlrpclib.Transport.request` does. Requests which
+        time out are never sent again, as magento may still process them.
+
+        The response is returned as a :class:`ResponseReader`, which
+        decodes compressed bodies.
+        """
+        chost, extra_headers, x509 = self.get_host_info(host)
+        key = (self.secure, chost)
+        content_encoding = None
+        body = request_body
+        if self.compress_threshold is not None and \
+                len(request_body) > self.compress_threshold:
+            compressor = zlib.compressobj(
+                6, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+            )
+            body = compressor.compress(request_body) + compressor.flush()
+            content_encoding = 'gzip'
+        for attempt in (0, 1):
+            connection = self.pool.acquire(key)
+            reused = connection is not None
+            if connection is None:
+                connection = self.open_connection(chost, x509)
+            if verbose:
+                connection.set_debuglevel(1)
+            started = time.time()
+            try:
+                response = self.send(
+                    connection, chost, handler, body, extra_headers,
+                    content_encoding
+                )
+            except (socket.error, httplib.HTTPException) as exc:
+                connection.close()
+                if reused and not attempt and _connection_dropped(exc):
+                    continue
+                raise
+            if response.status != 200:
+                connection.close()
+                raise ProtocolError(
+                    host + handler, response.status,
+                    response.reason, response.msg
+                )
+            response = ResponseReader(response)
+            response.wait_time = time.time() - started
+            response.request_bytes = len(request_body)
+            response.request_wire_bytes = len(body)
+            return key, connection, response
+
+    def open_connection(self, host, x509=None):
+        """
+        Open a new HTTP(S) connection to the given host
+        """
+        kwargs = {}
+        if self.timeout is not None:
+            kwargs['timeout'] = self.timeout
+        if self.secure:
+            kwargs.update(x509 or {})
+            return httplib.HTTPSConnection(host, **kwargs)
+        return httplib.HTTPConnection(host, **kwargs)
+
+    def send(self, connection, host, handler, request_body, extra_headers,
+             content_encoding=None):
+        """
+        Send the request on the connection and return the response
+        """
+        connection.putrequest(
+            'POST', handler, skip_accept_encoding=self.accept_gzip
+        )
+        if self.accept_gzip:
+            connection.putheader('Accept-Encoding', 'gzip')
+        connection.putheader('User-Agent', self.user_agent)
+        connection.putheader('Content-Type', 'text/xml')
+        if content_encoding:
+            connection.putheader('Content-Encoding', content_encoding)
+        connection.putheader('Content-Length', str(len(request_body)))
+        for header, value in extra_headers or []:
+            connection.putheader(header, value)
+        try:
+            # Send the body with the headers, as a separate write would be
+            # held back by Nagle's algorithm on a kept alive connection
+            connection.endheaders(request_body)
+        except TypeError:
+            # Python < 2.7
+            connection.endheaders()
+            connection.send(request_body)
+        return connection.getresponse()
+
+    def parse_response(self, response):
+        """
+        Read the whole response body and unmarshall it
+        """
+        if self.fast_parser and not self.verbose:
+            return parse_response(response, self._use_datetime)
+        parser, unmarshaller = self.getparser()
+        while True:
+            data = response.read(16384)
+            if not data:
+                break
+            if self.verbose:
+                sys.stdout.write("body: %r\n" % data)
+            parser.feed(data)
+        parser.close()
+        return unmarshaller.close()
+
+    def done(self, key, connection, response, parse_started=None):
+        """
+        Return the connection to the pool unless the server asked for it
+        to be closed, once the response has been read, and account for
+        the request in the stats
+        """
+        stats = {
+            'request_bytes': response.request_bytes,
+            'request_wire_bytes': response.request_wire_bytes,
+            'response_bytes': response.bytes,
+            'response_wire_bytes': response.wire_bytes,
+            'network_time': response.wait_time + response.read_time,
+            'parse_time': None,
+        }
+        if parse_started is not None:
+            stats['parse_time'] = \
+                time.time() - parse_started - response.read_time
+        self._local.stats = stats
+        with self._stats_lock:
+            self.stats['requests'] += 1
+            for name in (
+                    'request_bytes', 'request_wire_bytes',
+                    'response_bytes', 'response_wire_bytes'):
+                self.stats[name] += stats[name]
+        if response.will_close:
+            connection.close()
+        else:
+            self.pool.release(key, connection)
+
+    def pop_stats(self):
+        """
+        Return the figures of the last request completed by the current
+        thread, and forget them. Returns None if the thread has completed
+        no request since the last call.
+
+        :return: Dictionary with the request and response bytes, before
+                 (`request_bytes`, `response_bytes`) and after compression
+                 (`request_wire_bytes`, `response_wire_bytes`), the
+                 seconds spent on the network (`network_time`) and parsing
+                 the response (`parse_time`)
+        """
+        stats = getattr(self._local, 'stats', None)
+        self._local.stats = None
+        return stats
+
+    def close(self):
+        """
+        Close all the idle connections of the pool
+        """
+        self.pool.clear()
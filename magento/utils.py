@@ -8,6 +8,12 @@
     :copyright: (c) 2010 by Openlabs Technologies & Consulting (P) LTD.
     :license: AGPLv3, see LICENSE for more details
 '''
+from collections import deque
+from itertools import islice
+
+from concurrent.futures import ThreadPoolExecutor
+
+from magento.throttle import RateLimiter
 
 
 def expand_url(url, protocol):
@@ -24,3 +30,85 @@ def expand_url(url, protocol):
         ws_part = 'index.php/api/xmlrpc'
     return url.endswith('/') and url + ws_part or url + '/' + ws_part
 
+
+#: Highest ID of an entity of magento, stored in an unsigned INT column
+MAX_ENTITY_ID = 2 ** 32 - 1
+
+
+def iter_id_ranges(list_method, filters=None, chunk=5000, max_gap=10,
+                   key='entity_id', start=1):
+    """
+    Iterate over the records of a list API which has no paging of its own,
+    by calling it for consecutive ranges of `chunk` entity IDs.
+
+    Magento gives no cheap way to know the highest ID in use, so after
+    `max_gap` consecutive ranges without any record, each empty range is
+    followed by one twice as large, up to :data:`MAX_ENTITY_ID`. A gap in
+    the IDs is thus crossed, and the end of the records found, in a number
+    of calls which grows with the logarithm of its size. Once a range has
+    records, the ranges are `chunk` IDs again. The range which ends a gap
+    holds at most as many IDs as the gap.
+
+    :param list_method: Function called with the filters of each range,
+                        eg `product_api.list`
+    :param filters: Dictionary of filters applied on top of the ID range
+    :param chunk: Number of IDs covered by each call
+    :param max_gap: Number of empty ranges after which the ranges grow
+    :param key: Field on which the ID range filter is applied
+    :param start: ID of the first range, to resume an iteration
+    """
+    size, empty = chunk, 0
+    while start <= MAX_ENTITY_ID:
+        window = dict(filters or {})
+        window[key] = {
+            'from': start, 'to': min(start + size - 1, MAX_ENTITY_ID),
+        }
+        records = list_method(window)
+        start += size
+        if records:
+            size, empty = chunk, 0
+            for record in records:
+                yield record
+            continue
+        empty += 1
+        if empty >= max_gap:
+            size *= 2
+
+
+def parallel_map(function, items, workers=4, rate=None):
+    """
+    Call the function for each of the items in a pool of worker threads
+    and yield the results in the order of the items.
+
+    Results are yielded as soon as they and all the results before them
+    are available. Only a few calls per worker are queued ahead, so the
+    items can be a long running generator.
+
+    :param function: Function called with each item
+    :param items: Iterable of items
+    :param workers: Number of worker threads
+    :param rate: Maximum number of calls started per second (optional)
+    """
+    limiter = rate and RateLimiter(rate)
+
+    def call(item):
+        if limiter:
+            limiter.acquire()
+        return function(item)
+
+    items = iter(items)
+    executor = ThreadPoolExecutor(workers)
+    pending = deque(
+        executor.submit(call, item) for item in islice(items, workers * 2)
+    )
+    try:
+        while pending:
+            future = pending.popleft()
+            for item in islice(items, 1):
+                pending.append(executor.submit(call, item))
+            yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(False)
+
@@ -27,6 +27,7 @@ setup(
     platforms='any',
     install_requires=[
         'suds>=0.3.9',
+        'futures>=2.1.3',
     ],
     classifiers=[
         'Development Status :: 6 - Mature',